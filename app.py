@@ -1,237 +1,902 @@
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from transformers import pipeline
-from datetime import datetime
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import List, Literal, Optional
+from inference import InferenceOverloaded, MicroBatcher
+from inference_server import RemoteGenerator, start_inference_server
+from log_setup import VERBOSE, RequestIdMiddleware, dropped_records, setup_logging, stop_logging
+from intents import enhance_prompt_for_codet5, extract_color, generate_fallback_code, generic_fallback_code, model_prompts, parse_command, split_compound
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry
+from model_registry import load_registry
+from response_cache import ResponseCache
+from retrieval import RetrievalIndex
+from script_store import ScriptStore
+from streaming import make_token_streamer, sse_event
+from stopping import banned_index, close_statement, make_stopping_criteria, scan_js, statement_end
+import asyncio
+import gc
+import hashlib
+import hmac
 import json
+import logging
 import os
 import platform
-import torch
-from fastapi.responses import FileResponse
+import re
+import sys
+import threading
+import time
+import zipfile
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, field_validator
 
-app = FastAPI()
-
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+# Logs go through a queue to a writer thread, so request handlers never wait on stdout
+setup_logging(
+    level=os.environ.get("LOG_LEVEL", "INFO"),
+    fmt=os.environ.get("LOG_FORMAT", "text").lower(),
+    sample_rate=float(os.environ.get("LOG_SAMPLE_RATE", "1.0")),
+    max_queue=int(os.environ.get("LOG_QUEUE_MAX", "10000")),
 )
+logger = logging.getLogger(__name__)
+
+# Unix socket of a shared inference process (see inference_server.py); when set, this
+# process does not load the model itself, and never imports torch or transformers
+INFERENCE_SERVER = os.environ.get("INFERENCE_SERVER")
+
+def parse_args(argv=None):
+    """Command line of `python app.py`"""
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_WORKERS", "1")),
+                        help="HTTP worker processes; more than one shares a single inference process")
+    parser.add_argument("--port", type=int, default=8000)
+    return parser.parse_args(argv)
+
+# Read before any torch work: `python app.py --workers N` with N > 1 only starts the inference
+# process and the HTTP workers, so it needs neither torch nor a device
+CLI_ARGS = parse_args() if __name__ == "__main__" else None
+LAUNCHER = CLI_ARGS is not None and CLI_ARGS.workers > 1
 
 # Cross-platform device detection
 def get_device():
     """Detect best device for current platform"""
+    import torch
     system = platform.system().lower()
     
     if torch.cuda.is_available():
-        print("Using CUDA (NVIDIA GPU)")
+        logger.info("Using CUDA (NVIDIA GPU)")
         return "cuda"
     elif system == "darwin" and hasattr(torch.backends, 'mps') and torch.backends.mps.is_available():
-        print("Using MPS (Apple Silicon)")
+        logger.info("Using MPS (Apple Silicon)")
         return "mps"
     else:
-        print("Using CPU")
+        logger.info("Using CPU")
         return "cpu"
 
-# Load model with cross-platform device support
-print(f"Platform: {platform.system()} {platform.machine()}")
-device = get_device()
+logger.info("Platform: %s %s", platform.system(), platform.machine())
+# With a shared inference process the device is the one it reports
+device = None if INFERENCE_SERVER or LAUNCHER else get_device()
+
+# Models that can be served, by id (see model_registry.py); MODEL_NAME overrides the default
+MODELS_FILE = os.environ.get("MODELS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models.json"))
+MODEL_REGISTRY, DEFAULT_MODEL_ID = load_registry(MODELS_FILE, os.environ.get("MODEL_NAME"))
+MODEL_NAME = MODEL_REGISTRY[DEFAULT_MODEL_ID].name
+
+# Unload the model after this many seconds without a generation (0 keeps it loaded); the
+# next request that needs it gets the fallback and starts a reload
+MODEL_IDLE_TIMEOUT = float(os.environ.get("MODEL_IDLE_TIMEOUT", "0"))
+
+# Required in the X-Admin-Token header of /admin endpoints when set
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# Opt-in CPU optimizations: "fp32" (default), "int8" (dynamic quantization of linear layers)
+# or "bf16" (bfloat16 weights, only where the CPU supports it natively)
+CPU_INFERENCE_MODE = os.environ.get("CPU_INFERENCE_MODE", "fp32").lower()
+
+def set_torch_threads():
+    import torch
+    if os.environ.get("TORCH_NUM_THREADS"):
+        torch.set_num_threads(int(os.environ["TORCH_NUM_THREADS"]))
+    if os.environ.get("TORCH_INTEROP_THREADS"):
+        torch.set_interop_threads(int(os.environ["TORCH_INTEROP_THREADS"]))
+
+# Thread counts must be set before torch runs any parallel work
+if not INFERENCE_SERVER and not LAUNCHER:
+    set_torch_threads()
 
-# Initialize generator as global variable
+def cpu_supports_bf16():
+    """True when the CPU has native bfloat16 instructions (AVX512-BF16 or AMX)"""
+    import torch
+    checks = [getattr(torch.cpu, name, None) for name in ("_is_avx512_bf16_supported", "_is_amx_tile_supported")]
+    return any(check() for check in checks if check is not None)
+
+def apply_cpu_inference_mode(loaded, mode):
+    """Optimize a CPU pipeline's model in place; returns the mode actually applied.
+
+    For int8, the number of quantized layers is kept in loaded.quantized_layers.
+    """
+    import torch
+    if mode == "int8":
+        quantized = torch.ao.quantization.quantize_dynamic(loaded.model, {torch.nn.Linear}, dtype=torch.qint8)
+        # Only nn.Linear is quantized; GPT-2 style models keep most of their weights in Conv1D layers
+        count = sum(isinstance(module, torch.ao.nn.quantized.dynamic.Linear) for module in quantized.modules())
+        skipped = sum(type(module).__name__ == "Conv1D" for module in quantized.modules())
+        if skipped:
+            logger.warning("int8: %d Conv1D layers cannot be quantized dynamically and stay on fp32", skipped)
+        if count == 0:
+            logger.warning("int8: the model has no linear layers to quantize, staying on fp32")
+            return "fp32"
+        logger.info("int8: quantized %d linear layers", count)
+        loaded.model = quantized
+        loaded.quantized_layers = count
+        return "int8"
+    if mode == "bf16":
+        if cpu_supports_bf16():
+            loaded.model = loaded.model.to(torch.bfloat16)
+            return "bf16"
+        logger.warning("bfloat16 is not supported natively on this CPU, staying on fp32")
+    elif mode != "fp32":
+        logger.warning("Unknown CPU_INFERENCE_MODE %r, staying on fp32", mode)
+    return "fp32"
+
+# Precompute token ids and encoder outputs / prefix KV for every enhanced prompt at load time
+PROMPT_CACHE = os.environ.get("PROMPT_CACHE", "true").lower() in ("1", "true", "yes")
+
+def attach_prompt_cache(loaded):
+    """Warm a PromptCache for the pipeline; generation uses it via loaded.prompt_cache"""
+    # Imported here: it needs torch, which workers of a shared inference process never load
+    from prompt_cache import PromptCache
+    try:
+        cache = PromptCache(loaded)
+        cache.warm(model_prompts())
+        loaded.prompt_cache = cache
+    except Exception as e:
+        logger.warning("Prompt cache unavailable, every prompt goes through the pipeline: %s", e)
+
+# Initialize generator as global variable (set by the background loader)
 generator = None
 
-# Load AI model pipeline
-try:
-    print("Loading AI model pipeline...")
-    generator = pipeline(
+# Connection to the shared inference process, when INFERENCE_SERVER is set
+inference_client = None
+# Its model_process_stats() as of the last status poll
+inference_model_stats = None
+# Seconds between polls of the inference process's model state (loads, swaps, unloads)
+INFERENCE_STATUS_INTERVAL = float(os.environ.get("INFERENCE_STATUS_INTERVAL", "1"))
+
+# One model load (initial, swap or reload) at a time
+_model_load_lock = threading.Lock()
+model_last_used = time.monotonic()
+
+# Model load state reported by /healthz and /readyz
+model_state = {
+    "status": "pending",  # pending -> loading -> quality_check -> ready | failed | disabled; ready -> unloaded -> loading
+    "model_id": DEFAULT_MODEL_ID,
+    "model": MODEL_NAME,
+    "device": device,
+    "inference_mode": None,
+    "quantized_layers": None,  # with CPU_INFERENCE_MODE=int8
+    "load_seconds": None,
+    "error": None,
+    "started_at": None,
+    "ready_at": None,
+    "quality": None,
+    "quality_cases": None,
+    "inference_server": None,
+    "swap": None,  # progress of the last model swap, while the current model keeps serving
+}
+
+def build_pipeline(spec):
+    """Load a registry model's text-generation pipeline, ready for batching; returns (pipeline, inference mode)"""
+    # Imported here so that importing app.py stays fast
+    from transformers import pipeline
+    loaded = pipeline(
         "text-generation",
-        model="Salesforce/codet5p-770m",  # or try "microsoft/CodeGPT-small-py"
+        model=spec.name,
+        revision=spec.revision,
         device=device,
         max_length=512
     )
-    print(f"✅ AI model pipeline loaded successfully on {device}")
-except Exception as e:
-    print(f"❌ Failed to load AI model: {e}")
-    generator = None
-    print("🔄 Falling back to pattern-based system (100% reliable)")
-
-def enhance_prompt_for_codet5(user_prompt):
-    """Better prompts for CodeT5+ model"""
-    prompt_lower = user_prompt.lower()
-    
-    # CodeT5+ works better with simpler, more direct prompts
-    if "button" in prompt_lower and any(color in prompt_lower for color in ['red', 'blue', 'green', 'yellow', 'purple', 'orange', 'pink']):
-        color = extract_color(user_prompt)
-        return f"document.querySelectorAll('button').forEach(btn => btn.style.backgroundColor = '{color}'"
-    elif "background" in prompt_lower and any(color in prompt_lower for color in ['red', 'blue', 'green', 'yellow', 'purple', 'orange', 'pink']):
-        color = extract_color(user_prompt)
-        return f"document.body.style.backgroundColor = '{color}'"
-    elif "hide" in prompt_lower and "image" in prompt_lower:
-        return f"document.querySelectorAll('img').forEach(img => img.style.display = 'none'"
-    elif "hide" in prompt_lower and "button" in prompt_lower:
-        return f"document.querySelectorAll('button').forEach(btn => btn.style.display = 'none'"
+    # Batched generation needs a pad token; pad on the left for decoder-only models
+    tokenizer = loaded.tokenizer
+    if tokenizer is not None and tokenizer.pad_token_id is None:
+        tokenizer.pad_token_id = tokenizer.eos_token_id
+    if tokenizer is not None and not loaded.model.config.is_encoder_decoder:
+        tokenizer.padding_side = "left"
+    inference_mode = apply_cpu_inference_mode(loaded, CPU_INFERENCE_MODE) if device == "cpu" else "default"
+    return loaded, inference_mode
+
+def load_model(model_id=None):
+    """Load a registry model (default: the current one) and serve it once it passes the quality gate.
+
+    Runs on a background thread so startup never blocks on it. If a model is already serving,
+    it keeps serving until the new one is ready, with progress in model_state["swap"]; the swap
+    is a single assignment, so batches already running finish on the old model.
+    Returns False without loading if another load is in progress.
+    """
+    if not _model_load_lock.acquire(blocking=False):
+        logger.info("Another model load is in progress")
+        return False
+    _load_model_locked(model_id)
+    return True
+
+def start_model_load(model_id=None):
+    """load_model on a background thread; False if a load is already running"""
+    # Taken here rather than on the thread, so two concurrent calls cannot both start a load
+    if not _model_load_lock.acquire(blocking=False):
+        return False
+    threading.Thread(target=_load_model_locked, args=(model_id,), name="model-loader", daemon=True).start()
+    return True
+
+def _load_model_locked(model_id):
+    """The body of load_model; the caller holds _model_load_lock, which this releases"""
+    try:
+        _load_model(model_id)
+    finally:
+        _model_load_lock.release()
+
+def _load_model(model_id):
+    global generator, model_last_used
+    spec = MODEL_REGISTRY[model_id or model_state["model_id"]]
+    kind = "swap" if generator is not None else ("reload" if model_state["status"] == "unloaded" else "initial")
+    if kind == "swap":
+        progress = model_state["swap"] = {"model_id": spec.id, "model": spec.name}
     else:
-        return f"document.querySelectorAll"
+        progress = model_state
+        progress.update(model_id=spec.id, model=spec.name)
+    progress.update(status="loading", started_at=datetime.now().isoformat(), error=None, load_seconds=None)
+    start = time.perf_counter()
+    try:
+        logger.info("Loading AI model pipeline %s (%s)...", spec.id, spec.name)
+        loaded, inference_mode = build_pipeline(spec)
+        progress["inference_mode"] = inference_mode
+        progress["quantized_layers"] = getattr(loaded, "quantized_layers", None)
+        progress["load_seconds"] = round(time.perf_counter() - start, 3)
+        logger.info("✅ AI model pipeline loaded on %s (%s) in %ss", device, inference_mode, progress["load_seconds"])
+        
+        # Quality gate before serving, so no user request pays for it
+        progress["status"] = "quality_check"
+        quality = check_model_quality(loaded, spec.name, f"{device}/{inference_mode}")
+        progress["quality"] = {k: v for k, v in quality.items() if k != "cases"}
+        progress["quality_cases"] = [{k: c[k] for k in ("prompt", "passed", "seconds")} for c in quality["cases"]]
+        if not quality["passed"]:
+            progress["status"] = "disabled"
+            model_loads.inc(kind, "disabled")
+            logger.warning("Model %s failed quality test - disabling AI", spec.id)
+            if kind == "swap":
+                logger.warning("Keeping %s", model_state["model_id"])
+            else:
+                # Fallback answers cached while the model was unavailable are stale now
+                response_cache.purge()
+                logger.warning("🔄 Falling back to pattern-based system (100% reliable)")
+            return
+        if PROMPT_CACHE:
+            attach_prompt_cache(loaded)
+        model_last_used = time.monotonic()
+        generator = loaded
+        if kind == "swap":
+            model_state.update(progress)
+            progress["status"] = "done"
+        model_state["status"] = "ready"
+        model_state["ready_at"] = datetime.now().isoformat()
+        # Answers cached from the previous model (or the fallback) are stale now
+        response_cache.purge()
+        model_load_duration.observe(time.perf_counter() - start, kind)
+        model_loads.inc(kind, "ok")
+        logger.info("✅ AI model %s ready on %s (%s in %.1fs)", spec.id, device, kind, time.perf_counter() - start)
+    except Exception as e:
+        if progress["load_seconds"] is None:
+            progress["load_seconds"] = round(time.perf_counter() - start, 3)
+        progress["status"] = "failed"
+        progress["error"] = str(e)
+        model_loads.inc(kind, "failed")
+        logger.exception("❌ Failed to load AI model %s: %s", spec.id, e)
+        if kind != "swap":
+            generator = None
+            logger.warning("🔄 Falling back to pattern-based system (100% reliable)")
 
-def extract_color(text):
-    """Extract color from user input"""
-    colors = ['red', 'blue', 'green', 'yellow', 'purple', 'orange', 'pink', 'black', 'white', 'gray', 'grey', 'brown', 'cyan', 'magenta', 'lime', 'navy', 'maroon', 'olive', 'teal', 'silver', 'gold', 'lightpink', 'lightblue', 'lightgreen']
-    text_lower = text.lower()
-    
-    # Check for compound colors first (lightpink, lightblue, etc.)
-    for color in sorted(colors, key=len, reverse=True):
-        if color in text_lower:
-            return color
-    return 'blue'  # default
+def unload_model(reason):
+    """Drop the model so its memory can be freed; the next request that needs it loads it again"""
+    global generator
+    if INFERENCE_SERVER or not _model_load_lock.acquire(blocking=False):
+        return False
+    try:
+        if generator is None:
+            return False
+        # Batches still running keep their own reference until they finish
+        generator = None
+        model_state["status"] = "unloaded"
+        model_state["ready_at"] = None
+    finally:
+        _model_load_lock.release()
+    gc.collect()
+    if device == "cuda":
+        import torch
+        torch.cuda.empty_cache()
+    model_unloads.inc(reason)
+    logger.info("Unloaded model %s (%s)", model_state["model_id"], reason)
+    return True
 
-@app.get("/generate")
-def generate_code(prompt: str = Query(...)):
-    global generator  # Add this line to access global variable
-    
-    if generator is None:
-        fallback_code = generate_fallback_code(prompt)
-        print(f"Using fallback pattern for: {prompt}")
-        print(f"Generated fallback code: {fallback_code}")
-        return {"code": fallback_code, "source": "fallback", "prompt": prompt, "timestamp": datetime.now().isoformat()}
-    
-    # Test model on first use (safer check)
-    if not hasattr(generate_code, 'model_tested'):
-        generate_code.model_tested = True
+def unload_idle_model():
+    """Background loop: unload the model after MODEL_IDLE_TIMEOUT seconds without a generation"""
+    while True:
+        time.sleep(min(max(MODEL_IDLE_TIMEOUT / 4, 1.0), 30.0))
+        if generator is not None and time.monotonic() - model_last_used >= MODEL_IDLE_TIMEOUT:
+            unload_model("idle")
+
+def use_model():
+    """The generator for a generation about to run (None if there is none); starts a reload if it was unloaded"""
+    global model_last_used
+    model_last_used = time.monotonic()
+    model = generator
+    if model is None and model_state["status"] == "unloaded":
+        reload_model()
+    return model
+
+def reload_model():
+    """Start loading the unloaded model again, here or in the shared inference process"""
+    if inference_client is None:
+        start_model_load()
+        return
+    try:
+        inference_client.load_model(None)
+    except Exception as e:
+        logger.warning("Could not ask the inference server to reload the model: %s", e)
+        return
+    # Until the next status poll, so requests meanwhile do not ask again
+    model_state["status"] = "loading"
+
+def follow_inference_state(state):
+    """Mirror the inference server's model state and stats; serve through it only while its model is ready"""
+    global generator, inference_model_stats
+    inference_model_stats = {k: state.get(k) for k in ("metrics", "early_stopping", "prompt_cache")}
+    previous = (model_state["status"], model_state["model_id"], model_state["ready_at"])
+    model_state.update({k: v for k, v in state.items() if k in model_state and k != "inference_server"})
+    current = (model_state["status"], model_state["model_id"], model_state["ready_at"])
+    if current == previous:
+        return
+    generator = inference_client if model_state["status"] == "ready" else None
+    if current[1:] != previous[1:] or model_state["status"] in ("failed", "disabled"):
+        # Answers cached from the previous model (or the fallback) are stale now
+        response_cache.purge()
+    if generator is not None:
+        logger.info("✅ Using the shared AI model %s at %s", model_state["model_id"], INFERENCE_SERVER)
+    elif model_state["status"] in ("failed", "disabled", "unloaded"):
+        logger.warning("🔄 Shared AI model is %s, falling back to pattern-based system", model_state["status"])
+
+def connect_inference_server():
+    """Background loop: follow the shared inference process's model state, reconnecting if it goes away"""
+    global generator, inference_client
+    model_state["status"] = "loading"
+    model_state["inference_server"] = INFERENCE_SERVER
+    authkey = os.environ.get("INFERENCE_SERVER_AUTHKEY", "").encode() or None
+    while True:
+        if inference_client is None:
+            try:
+                inference_client = RemoteGenerator(INFERENCE_SERVER, authkey)
+            except OSError:
+                # The inference process may still be starting
+                time.sleep(0.5)
+                continue
         try:
-            if not test_model_quality(generator, ["test"]):
-                print("Model failed quality test - disabling AI")
-                generator = None
-                fallback_code = generate_fallback_code(prompt)
-                print(f"Using fallback pattern for: {prompt}")
-                print(f"Generated fallback code: {fallback_code}")
-                return {"code": fallback_code, "source": "fallback", "prompt": prompt, "timestamp": datetime.now().isoformat()}
+            follow_inference_state(inference_client.status())
         except Exception as e:
-            print(f"Model testing failed: {e} - disabling AI")
+            if model_state["status"] != "failed":
+                logger.error("❌ Lost the inference server at %s: %s", INFERENCE_SERVER, e)
             generator = None
-            fallback_code = generate_fallback_code(prompt)
-            print(f"Using fallback pattern for: {prompt}")
-            print(f"Generated fallback code: {fallback_code}")
-            return {"code": fallback_code, "source": "fallback", "prompt": prompt, "timestamp": datetime.now().isoformat()}
+            model_state["status"] = "failed"
+            model_state["error"] = str(e)
+            inference_client.close()
+            inference_client = None
+        time.sleep(INFERENCE_STATUS_INTERVAL)
+
+@asynccontextmanager
+async def lifespan(app):
+    # Start serving immediately; /generate uses the fallback until the model is ready.
+    # Daemon thread so a shutdown during a slow load is not held up by it.
+    target = connect_inference_server if INFERENCE_SERVER else load_model
+    threading.Thread(target=target, name="model-loader", daemon=True).start()
+    if MODEL_IDLE_TIMEOUT > 0 and not INFERENCE_SERVER:
+        threading.Thread(target=unload_idle_model, name="model-idle", daemon=True).start()
+    if RETRIEVAL_THRESHOLD <= 1:
+        threading.Thread(target=follow_retrieval_index, name="retrieval-index", daemon=True).start()
+    yield
+    stop_logging()
+
+app = FastAPI(lifespan=lifespan)
+
+# CORS middleware
+class CORSExceptAdminMiddleware(CORSMiddleware):
+    """CORS for the extension and web pages, except on /admin: no page may call those"""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and (scope["path"] == "/admin" or scope["path"].startswith("/admin/")):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+app.add_middleware(
+    CORSExceptAdminMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+# Request ids for the logs, echoed back as X-Request-ID
+app.add_middleware(RequestIdMiddleware)
+
+# CodeT5+ compatible parameters
+GENERATION_PARAMS = {
+    "max_new_tokens": 40,
+    "num_return_sequences": 1,
+    # Sampling makes answers vary between calls; turn it off for consistent cached answers
+    "do_sample": os.environ.get("GENERATION_DO_SAMPLE", "true").lower() in ("1", "true", "yes"),
+    "top_p": 0.85,
+    "repetition_penalty": 1.1,
+    "truncation": True,
+    "pad_token_id": 0
+}
+
+# Decode steps used vs. max_new_tokens, to show what early stopping saves
+decode_stats = {"requests": 0, "decode_steps": 0, "decode_steps_saved": 0, "stopped_early": 0, "cancelled": 0}
+_decode_stats_lock = threading.Lock()
+
+def record_decode_steps(steps, max_new_tokens, cancelled=None):
+    """Count one generation per row; rows cut short by a client going away are not early stops"""
+    with _decode_stats_lock:
+        for used, was_cancelled in zip(steps, cancelled or [False] * len(steps)):
+            decode_stats["requests"] += 1
+            decode_stats["decode_steps"] += used
+            if was_cancelled:
+                decode_stats["cancelled"] += 1
+                continue
+            decode_stats["decode_steps_saved"] += max(max_new_tokens - used, 0)
+            decode_stats["stopped_early"] += used < max_new_tokens
+
+def get_decode_stats():
+    with _decode_stats_lock:
+        stats = dict(decode_stats)
+    requests = stats["requests"]
+    stats["avg_decode_steps"] = round(stats["decode_steps"] / requests, 2) if requests else 0.0
+    stats["avg_decode_steps_saved"] = round(stats["decode_steps_saved"] / requests, 2) if requests else 0.0
+    return stats
+
+def run_generator_batch(prompts, params):
+    """Run one padded, batched generate call; returns one result list per prompt"""
+    model = use_model()
+    if model is None:
+        raise RuntimeError("AI model is not loaded")
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is None:
+        return model(prompts, batch_size=len(prompts), **params)
     
-    try:
-        enhanced_prompt = enhance_prompt_for_codet5(prompt)
-        print(f"Original prompt: {prompt}")
-        print(f"Enhanced prompt: {enhanced_prompt}")
-        
-        # CodeT5+ compatible parameters
-        generation_params = {
-            "max_new_tokens": 40,
-            "num_return_sequences": 1,
-            "do_sample": True,
-            "top_p": 0.85,
-            "repetition_penalty": 1.1,
-            "truncation": True,
-            "pad_token_id": 0
-        }
-        
-        result = generator(enhanced_prompt, **generation_params)
-        full_text = result[0]['generated_text']
-        code = full_text.replace(enhanced_prompt, "").strip()
-        
-        print(f"Raw AI output: {repr(code)}")
-        
-        # Try to complete the code if it looks promising
-        if code and len(code) > 5:
-            # Clean up and try to complete partial JavaScript
-            code = code.replace('\n', ' ').strip()
-            
-            # Add missing closing parts
-            if 'forEach' in code and not code.endswith(');'):
-                if not code.endswith("'"):
-                    code += "');"
-                else:
-                    code += ");"
-            elif 'style.' in code and not code.endswith(';'):
-                if not code.endswith("'"):
-                    code += "';"
-                else:
-                    code += ";"
-            
-            # Validation for completed code
-            if (code and 
-                len(code) > 15 and
-                'document.' in code and
-                ('style.' in code or 'querySelector' in code) and
-                code.endswith(';') and
-                not any(bad in code.lower() for bad in ['def ', 'import ', 'print(', 'class ', '</', 'html'])):
-                
-                print(f"Generated AI code: {code}")
-                return {"code": code, "source": "ai", "prompt": prompt, "timestamp": datetime.now().isoformat()}
-        
-        print(f"AI generated invalid code, using fallback")
-        
-    except Exception as e:
-        print(f"AI model failed: {e}, using fallback")
+    # End each row as soon as it completes a statement instead of always decoding max_new_tokens
+    stopping_criteria, criterion = make_stopping_criteria(tokenizer, prompts)
+    prompt_cache = getattr(model, "prompt_cache", None)
+    results = prompt_cache.generate(prompts, params, stopping_criteria) if prompt_cache is not None else None
+    if results is None:
+        results = model(prompts, batch_size=len(prompts), stopping_criteria=stopping_criteria, **params)
+    record_decode_steps(criterion.steps, params["max_new_tokens"])
+    return results
+
+def run_generator_stream(prompt, params, on_text, cancel):
+    """Generate for one prompt, passing decoded text to on_text as it comes; stops soon after cancel is set"""
+    model = use_model()
+    if model is None:
+        raise RuntimeError("AI model is not loaded")
+    stopping_criteria, criterion = make_stopping_criteria(model.tokenizer, [prompt], cancel=cancel)
+    streamer = make_token_streamer(model.tokenizer, on_text)
+    prompt_cache = getattr(model, "prompt_cache", None)
+    results = prompt_cache.generate([prompt], params, stopping_criteria, streamer) if prompt_cache is not None else None
+    result = results[0] if results is not None else model(prompt, streamer=streamer, stopping_criteria=stopping_criteria, **params)
+    record_decode_steps(criterion.steps, params["max_new_tokens"], criterion.cancelled)
+    return result
+
+def postprocess_ai_output(enhanced_prompt, full_text):
+    """Turn a completion of the enhanced prompt into one validated statement, or None"""
+    output = full_text.replace(enhanced_prompt, "", 1).replace('\n', ' ')
+    # Anything from a banned token on is not JavaScript for this page
+    cut = banned_index(output)
+    if cut is not None:
+        output = output[:cut]
+    
+    end = statement_end(output, scan_js(enhanced_prompt))
+    if end is not None:
+        code = enhanced_prompt + output[:end]
+    elif output.strip() and set(output.strip()) <= set(")]}'\"`; "):
+        # The model only produced closing characters but no full ";": close the prompt's statement
+        code = close_statement(enhanced_prompt)
+    else:
+        return None
+    code = code.strip()
     
+    depth, quote, _ = scan_js(code)
+    # Validation for completed code
+    if (len(code) > 15 and
+        depth == 0 and quote is None and
+        'document.' in code and
+        ('style.' in code or 'querySelector' in code) and
+        ('=' in code or code.rstrip(';').endswith(')')) and
+        code.endswith(';') and
+        not any(bad in code.lower() for bad in ['def ', 'import ', 'print(', 'class ', '</', 'html'])):
+        return code
+    return None
+
+batcher = MicroBatcher(
+    run_generator_batch,
+    max_batch_size=int(os.environ.get("BATCH_MAX_SIZE", "8")),
+    window_ms=float(os.environ.get("BATCH_WINDOW_MS", "10")),
+    # With a shared inference process the real batching happens there; more slots keep requests in flight
+    slots=int(os.environ.get("INFERENCE_SLOTS", "4" if INFERENCE_SERVER else "1")),
+    max_queue=int(os.environ.get("INFERENCE_QUEUE_MAX", "32")),
+)
+
+# What to do when the inference queue is full: "fallback" answers from patterns, "429" rejects
+OVERLOAD_POLICY = os.environ.get("OVERLOAD_POLICY", "fallback").lower()
+
+# Prometheus metrics served on /metrics
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram("generate_stage_seconds", "Time spent in each /generate stage", ("stage",))
+generate_responses = metrics.counter("generate_responses_total", "/generate responses by source and whether they came from the cache", ("source", "cached"))
+# Series recorded where the model runs; with a shared inference process its workers report
+# the copy it sends with every status reply (see model_process_stats)
+model_metrics = MetricsRegistry()
+model_load_duration = model_metrics.histogram(
+    "model_load_duration_seconds", "Time from starting a model load to serving it, by kind (initial, swap, reload)", ("kind",),
+    buckets=(1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0),
+)
+model_loads = model_metrics.counter("model_loads_total", "Model loads by kind and result (ok, disabled, failed)", ("kind", "result"))
+model_unloads = model_metrics.counter("model_unloads_total", "Models unloaded to free memory, by reason (idle, admin)", ("reason",))
+fallback_reasons = metrics.counter("generate_fallback_total", "Fallback answers computed instead of a model answer, by reason", ("reason",))
+
+response_cache = ResponseCache(
+    max_entries=int(os.environ.get("RESPONSE_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.environ.get("RESPONSE_CACHE_TTL", "3600")),
+)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+def cache_key(prompt):
+    """Normalize a prompt for the response cache: case, whitespace, punctuation and color"""
+    text = " ".join(_PUNCTUATION.sub(" ", prompt.lower()).split())
+    return (text, extract_color(prompt))
+
+def cache_response(key, response):
+    """Store a validated AI or fallback response"""
+    # The generic fallback embeds the raw prompt, so it can't be shared between prompts
+    if response["code"] == generic_fallback_code(response["prompt"]):
+        return
+    response_cache.put(key, {"code": response["code"], "source": response["source"]})
+
+def fallback_response(prompt, reason):
+    """Build a /generate response from the pattern-based fallback; reason is counted in the metrics"""
+    start = time.perf_counter()
     fallback_code = generate_fallback_code(prompt)
-    print(f"Using fallback pattern for: {prompt}")
-    print(f"Generated fallback code: {fallback_code}")
+    stage_seconds.observe(time.perf_counter() - start, "fallback")
+    fallback_reasons.inc(reason)
+    logger.info("Using fallback pattern (%s) for: %s", reason, prompt, extra=VERBOSE)
+    logger.info("Generated fallback code: %s", fallback_code, extra=VERBOSE)
     return {"code": fallback_code, "source": "fallback", "prompt": prompt, "timestamp": datetime.now().isoformat()}
 
-def generate_fallback_code(prompt):
-    """Generate reliable fallback code with enhanced patterns"""
-    prompt_lower = prompt.lower()
+# Default latency budget for the model; the fallback answers when it runs out (0 disables it)
+GENERATE_DEADLINE_MS = float(os.environ.get("GENERATE_DEADLINE_MS", "1500"))
+
+def enhance_prompt(prompt):
+    start = time.perf_counter()
+    enhanced_prompt = enhance_prompt_for_codet5(prompt)
+    stage_seconds.observe(time.perf_counter() - start, "enhance")
+    logger.info("Original prompt: %s", prompt, extra=VERBOSE)
+    logger.info("Enhanced prompt: %s", enhanced_prompt, extra=VERBOSE)
+    return enhanced_prompt
+
+def model_result_response(prompt, key, enhanced_prompt, result):
+    """Validate one model result and cache it (or the fallback if it is invalid)"""
+    full_text = result[0]['generated_text']
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Raw AI output: %r", full_text.replace(enhanced_prompt, '', 1), extra=VERBOSE)
     
-    # Extract color
-    found_color = extract_color(prompt)
+    start = time.perf_counter()
+    code = postprocess_ai_output(enhanced_prompt, full_text)
+    stage_seconds.observe(time.perf_counter() - start, "postprocess")
+    if code is not None:
+        logger.info("Generated AI code: %s", code, extra=VERBOSE)
+        response = {"code": code, "source": "ai", "prompt": prompt, "timestamp": datetime.now().isoformat()}
+        cache_response(key, response)
+        return response
     
-    # Enhanced pattern matching
-    if "button" in prompt_lower and found_color:
-        return f"document.querySelectorAll('button').forEach(btn => btn.style.backgroundColor = '{found_color}');"
-    elif "background" in prompt_lower and found_color:
-        return f"document.body.style.backgroundColor = '{found_color}';"
-    elif "text" in prompt_lower and found_color and "color" in prompt_lower:
-        return f"document.body.style.color = '{found_color}';"
-    elif "hide" in prompt_lower and ("button" in prompt_lower):
-        return "document.querySelectorAll('button').forEach(btn => btn.style.display = 'none');"
-    elif "show" in prompt_lower and ("button" in prompt_lower):
-        return "document.querySelectorAll('button').forEach(btn => btn.style.display = 'block');"
-    elif "hide" in prompt_lower and ("image" in prompt_lower or "img" in prompt_lower):
-        return "document.querySelectorAll('img').forEach(img => img.style.display = 'none');"
-    elif "show" in prompt_lower and ("image" in prompt_lower or "img" in prompt_lower):
-        return "document.querySelectorAll('img').forEach(img => img.style.display = 'block');"
-    elif ("small" in prompt_lower or "smaller" in prompt_lower) and "image" in prompt_lower:
-        return "document.querySelectorAll('img').forEach(img => img.style.width = '50px');"
-    elif ("big" in prompt_lower or "larger" in prompt_lower) and "image" in prompt_lower:
-        return "document.querySelectorAll('img').forEach(img => img.style.width = '200px');"
-    elif "text" in prompt_lower and ("big" in prompt_lower or "larger" in prompt_lower):
-        return "document.body.style.fontSize = '20px';"
-    elif "text" in prompt_lower and ("small" in prompt_lower or "smaller" in prompt_lower):
-        return "document.body.style.fontSize = '12px';"
-    elif "bold" in prompt_lower:
-        return "document.body.style.fontWeight = 'bold';"
-    elif "italic" in prompt_lower:
-        return "document.body.style.fontStyle = 'italic';"
+    logger.info("AI generated invalid code, using fallback")
+    response = fallback_response(prompt, "invalid_output")
+    cache_response(key, response)
+    return response
+
+async def model_response(prompt, key):
+    """Run the model for a prompt and cache the validated result (or the fallback if it is invalid)"""
+    enhanced_prompt = enhance_prompt(prompt)
+    # Batched together with other requests arriving in the same window; includes the queue wait
+    start = time.perf_counter()
+    try:
+        result = await batcher.submit(enhanced_prompt, GENERATION_PARAMS)
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, "model")
+    return model_result_response(prompt, key, enhanced_prompt, result)
+
+async def model_responses(prompts, keys):
+    """Like model_response for several prompts, queued together so they share one batch"""
+    enhanced_prompts = [enhance_prompt(prompt) for prompt in prompts]
+    start = time.perf_counter()
+    try:
+        results = await batcher.submit_many(enhanced_prompts, GENERATION_PARAMS)
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, "model")
+    return [model_result_response(*args) for args in zip(prompts, keys, enhanced_prompts, results)]
+
+def _finish_in_background(task):
+    # The result already went to the response cache; only surface failures
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background AI generation failed: %s", task.exception())
+
+async def race_deadline(coro, deadline_ms):
+    """Await a model coroutine within deadline_ms; returns (result, None) or (None, fallback reason)"""
+    task = asyncio.ensure_future(coro)
+    try:
+        if deadline_ms > 0:
+            # shield: on timeout the model keeps going and its answer fills the cache for next time
+            return await asyncio.wait_for(asyncio.shield(task), deadline_ms / 1000), None
+        return await task, None
+    except asyncio.TimeoutError:
+        logger.info("Model missed the %.0fms deadline, using fallback", deadline_ms)
+        task.add_done_callback(_finish_in_background)
+        return None, "deadline"
+    except InferenceOverloaded as e:
+        logger.warning("Inference overloaded: %s", e)
+        if OVERLOAD_POLICY == "429":
+            raise HTTPException(status_code=429, detail="Model is busy, try again shortly", headers={"Retry-After": "1"})
+        return None, "overloaded"
+    except Exception as e:
+        logger.exception("AI model failed: %s, using fallback", e)
+        return None, "exception"
+
+def cached_response(prompt, key):
+    start = time.perf_counter()
+    cached = response_cache.get(key)
+    stage_seconds.observe(time.perf_counter() - start, "cache_lookup")
+    if cached is None:
+        return None
+    return {**cached, "prompt": prompt, "timestamp": datetime.now().isoformat(), "cached": True}
+
+async def unavailable_response(prompt, key):
+    """Fallback while there is no model to ask"""
+    if model_state["status"] == "unloaded":
+        # With a shared inference process this is a blocking round trip to it
+        await asyncio.to_thread(reload_model)
+        reason = "model_unloaded"
     else:
-        return f"console.log('Extension executed: {prompt}'); document.body.style.border = '2px solid green'; setTimeout(() => document.body.style.border = '', 2000);"
+        reason = "quality_gate_failed" if model_state["status"] == "disabled" else "model_missing"
+    response = fallback_response(prompt, reason)
+    # Only remember the fallback once the model is known to be unavailable
+    if model_state["status"] in ("failed", "disabled"):
+        cache_response(key, response)
+    return response
+
+@app.get("/generate")
+async def generate_code(prompt: str = Query(...), deadline_ms: Optional[float] = Query(None, ge=0)):
+    start = time.perf_counter()
+    response = await generate_response(prompt, deadline_ms)
+    stage_seconds.observe(time.perf_counter() - start, "total")
+    generate_responses.inc(response["source"], "true" if response.get("cached") else "false")
+    return response
+
+async def generate_response(prompt, deadline_ms):
+    key = cache_key(prompt)
+    response = cached_response(prompt, key)
+    if response is None:
+        response, = await retrieval_responses([(prompt, key)])
+    if response is not None:
+        return response
+    if generator is None:
+        return await unavailable_response(prompt, key)
+    
+    deadline_ms = GENERATE_DEADLINE_MS if deadline_ms is None else deadline_ms
+    response, reason = await race_deadline(model_response(prompt, key), deadline_ms)
+    if response is not None:
+        return response
+    response = fallback_response(prompt, reason)
+    if reason == "deadline":
+        response["reason"] = "deadline"
+    return response
+
+@app.get("/generate_stream")
+async def generate_stream(prompt: str = Query(...), deadline_ms: Optional[float] = Query(None, ge=0)):
+    """/generate as Server-Sent Events.
+
+    Events: "candidate" with the fallback code right away (when the model will be asked),
+    "token" with each piece of model output as it is decoded, then "final" with the same
+    validated response /generate returns, including on a missed deadline. Closing the
+    connection stops the generation.
+    """
+    deadline_ms = GENERATE_DEADLINE_MS if deadline_ms is None else deadline_ms
+    return StreamingResponse(
+        stream_generate_events(prompt, deadline_ms),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def stream_generate_events(prompt, deadline_ms):
+    start = time.perf_counter()
+    key = cache_key(prompt)
+    response = cached_response(prompt, key)
+    if response is None:
+        response, = await retrieval_responses([(prompt, key)])
+    if response is None and generator is None:
+        response = await unavailable_response(prompt, key)
+    if response is None:
+        yield sse_event("candidate", {"code": generate_fallback_code(prompt), "source": "fallback"})
+        if getattr(generator, "tokenizer", None) is None:
+            # A shared inference process only returns whole answers
+            try:
+                response, reason = await race_deadline(model_response(prompt, key), deadline_ms)
+            except HTTPException:
+                response, reason = None, "overloaded"
+        else:
+            response, reason = None, "exception"
+            async for event in stream_model_tokens(prompt, key, start, deadline_ms):
+                if isinstance(event, tuple):
+                    response, reason = event
+                else:
+                    yield event
+        if response is None:
+            response = fallback_response(prompt, reason)
+            if reason == "deadline":
+                response["reason"] = "deadline"
+    stage_seconds.observe(time.perf_counter() - start, "stream_total")
+    generate_responses.inc(response["source"], "true" if response.get("cached") else "false")
+    yield sse_event("final", response)
+
+async def _finish_stream_in_background(task, prompt, key, enhanced_prompt):
+    # Past the deadline: keep decoding so the answer is cached for next time
+    model_result_response(prompt, key, enhanced_prompt, await task)
+
+async def stream_model_tokens(prompt, key, start, deadline_ms):
+    """Yield a "token" event per decoded piece, then (response, None) or (None, fallback reason)"""
+    loop = asyncio.get_running_loop()
+    pieces = asyncio.Queue()
+    cancel = threading.Event()
+    enhanced_prompt = enhance_prompt(prompt)
+    model_start = time.perf_counter()
+    deadline = loop.time() + deadline_ms / 1000 if deadline_ms > 0 else None
+    # Through the batcher, so it waits for and takes one of the model's slots like a batch does
+    task = asyncio.ensure_future(batcher.run_alone(
+        run_generator_stream, enhanced_prompt, GENERATION_PARAMS,
+        lambda text: loop.call_soon_threadsafe(pieces.put_nowait, text), cancel,
+    ))
+    # Queued after the last piece, since the executor also reports back via call_soon_threadsafe
+    task.add_done_callback(lambda _: pieces.put_nowait(None))
+    first = True
+    detached = False
+    try:
+        while True:
+            try:
+                text = await asyncio.wait_for(pieces.get(), None if deadline is None else max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                logger.info("Model missed the %.0fms deadline while streaming, using fallback", deadline_ms)
+                detached = True
+                asyncio.ensure_future(_finish_stream_in_background(task, prompt, key, enhanced_prompt)).add_done_callback(
+                    _finish_in_background)
+                yield None, "deadline"
+                return
+            if text is None:
+                break
+            if first:
+                stage_seconds.observe(time.perf_counter() - start, "first_token")
+                first = False
+            yield sse_event("token", {"text": text})
+        result = await task
+        stage_seconds.observe(time.perf_counter() - model_start, "model")
+        yield model_result_response(prompt, key, enhanced_prompt, result), None
+    except InferenceOverloaded as e:
+        logger.warning("Inference overloaded: %s", e)
+        yield None, "overloaded"
+    except Exception as e:
+        logger.exception("AI model failed while streaming: %s, using fallback", e)
+    finally:
+        # Also reached when the client disconnects mid-stream: stop decoding for nobody
+        if not detached:
+            if not task.done():
+                logger.info("Client left, stopping generation")
+                task.cancel()
+            cancel.set()
+
+def utc_timestamp():
+    """Now in the format the popup saves (JS toISOString(), e.g. 2026-01-01T12:00:00.000Z), so since/until compare alike"""
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+# Most single commands one /generate_batch call may carry, after splitting compound prompts
+BATCH_COMMANDS_MAX = int(os.environ.get("BATCH_COMMANDS_MAX", "16"))
+
+@app.post("/generate_batch")
+async def generate_batch(batch_request: dict):
+    """Several commands in one call.
+
+    Body: {"prompts": [...], "url": ..., "save": true, "deadline_ms": ...}. Each prompt is also
+    split on conjunctions ("make buttons blue and hide images"). Commands that need the model
+    share one batched inference call; the rest come from the cache or the fallback. Returns
+    per-command results plus one combined script, saved with a single store write.
+    """
+    start = time.perf_counter()
+    prompts = batch_request.get("prompts")
+    if isinstance(prompts, str):
+        prompts = [prompts]
+    if not isinstance(prompts, list) or not prompts or not all(isinstance(p, str) and p.strip() for p in prompts):
+        raise HTTPException(status_code=400, detail="prompts must be a non-empty list of strings")
+    commands = [command for prompt in prompts for command in split_compound(prompt)]
+    if len(commands) > BATCH_COMMANDS_MAX:
+        raise HTTPException(status_code=400, detail=f"at most {BATCH_COMMANDS_MAX} commands per batch")
+    deadline_ms = batch_request.get("deadline_ms", GENERATE_DEADLINE_MS)
+    if not isinstance(deadline_ms, (int, float)) or deadline_ms < 0:
+        raise HTTPException(status_code=400, detail="deadline_ms must be a non-negative number")
+    
+    keys = [cache_key(command) for command in commands]
+    results = [cached_response(command, key) for command, key in zip(commands, keys)]
+    missed = [i for i, result in enumerate(results) if result is None]
+    for i, response in zip(missed, await retrieval_responses([(commands[i], keys[i]) for i in missed])):
+        results[i] = response
+    pending = [i for i, result in enumerate(results) if result is None]
+    if pending and generator is None:
+        for i in pending:
+            results[i] = await unavailable_response(commands[i], keys[i])
+    elif pending:
+        responses, reason = await race_deadline(
+            model_responses([commands[i] for i in pending], [keys[i] for i in pending]), deadline_ms
+        )
+        for n, i in enumerate(pending):
+            if responses is not None:
+                results[i] = responses[n]
+            else:
+                results[i] = fallback_response(commands[i], reason)
+                if reason == "deadline":
+                    results[i]["reason"] = "deadline"
+    for result in results:
+        generate_responses.inc(result["source"], "true" if result.get("cached") else "false")
+    
+    if batch_request.get("save", True):
+        saved_at = utc_timestamp()
+        entries = [{
+            "prompt": result["prompt"],
+            "code": result["code"],
+            "source": result["source"],
+            "success": None,
+            "timestamp": saved_at,
+            "url": batch_request.get("url", "unknown"),
+            "platform": platform.system(),
+        } for result in results]
+        ids = await asyncio.to_thread(script_store.add_many, entries)
+        for result, script_id in zip(results, ids):
+            result["id"] = script_id
+        logger.info("Saved %d scripts from a batch of %d prompts", len(ids), len(prompts))
+    stage_seconds.observe(time.perf_counter() - start, "batch_total")
+    return {
+        "results": results,
+        "code": "\n".join(result["code"] for result in results),
+        "timestamp": datetime.now().isoformat(),
+    }
 
 # Cross-platform file handling
 def get_scripts_file_path():
-    """Get platform-appropriate path for scripts file"""
+    """Get platform-appropriate path for the legacy JSON scripts file"""
     current_dir = os.path.dirname(os.path.abspath(__file__))
     return os.path.join(current_dir, "working_scripts.json")
 
+def get_scripts_db_path():
+    """Get platform-appropriate path for the scripts database"""
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.environ.get("SCRIPTS_DB_PATH", os.path.join(current_dir, "working_scripts.db"))
+
+# Imports working_scripts.json on first start, then renames it to working_scripts.json.migrated
+script_store = ScriptStore(get_scripts_db_path(), legacy_json_path=get_scripts_file_path())
+
 @app.post("/save_script")
 def save_script(script_data: dict):
     try:
-        scripts_file = get_scripts_file_path()
-        
-        # Load existing scripts
-        if os.path.exists(scripts_file):
-            with open(scripts_file, 'r', encoding='utf-8') as f:
-                scripts = json.load(f)
-        else:
-            scripts = []
-        
-        # Add new script
         script_entry = {
-            "id": len(scripts) + 1,
             "prompt": script_data.get("prompt"),
             "code": script_data.get("code"),
             "source": script_data.get("source", "unknown"),
@@ -240,44 +905,172 @@ def save_script(script_data: dict):
             "url": script_data.get("url", "unknown"),
             "platform": platform.system()
         }
-        scripts.append(script_entry)
-        
-        # Save to file with UTF-8 encoding
-        with open(scripts_file, 'w', encoding='utf-8') as f:
-            json.dump(scripts, f, indent=2, ensure_ascii=False)
+        script_id = script_store.add(script_entry)
         
-        print(f"Saved script #{script_entry['id']}: {script_data.get('prompt')}")
-        return {"message": "Script saved successfully", "id": script_entry["id"]}
+        logger.info("Saved script #%s: %s", script_id, script_data.get('prompt'), extra=VERBOSE)
+        return {"message": "Script saved successfully", "id": script_id}
     except Exception as e:
-        print(f"Error saving script: {e}")
+        logger.exception("Error saving script: %s", e)
         return {"error": str(e)}
 
+def stream_json_array(items, chunk_size=200):
+    """Serialize an iterable of dicts as a JSON array, a chunk of items at a time"""
+    yield "["
+    chunk = []
+    first = True
+    for item in items:
+        chunk.append(json.dumps(item, ensure_ascii=False))
+        if len(chunk) >= chunk_size:
+            yield ("" if first else ",") + ",".join(chunk)
+            first = False
+            chunk = []
+    if chunk:
+        yield ("" if first else ",") + ",".join(chunk)
+    yield "]"
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
 @app.get("/get_saved_scripts")
-def get_saved_scripts():
-    try:
-        scripts_file = get_scripts_file_path()
-        with open(scripts_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
+def get_saved_scripts(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    after_id: int = Query(0, ge=0),
+    url: Optional[str] = None,
+    source: Optional[str] = None,
+    success: Optional[bool] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+):
+    """Saved scripts in id order; page with limit/after_id, filter on url/source/success/timestamp range"""
+    etag = f'"scripts-{script_store.version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    
+    filters = {"url": url, "source": source, "success": success, "since": since, "until": until}
+    if limit is None:
+        # Whole (filtered) history, read from the store page by page while streaming
+        scripts = script_store.iter_scripts(after_id=after_id, **filters)
+    else:
+        scripts = script_store.list(after_id=after_id, limit=limit + 1, **filters)
+        if len(scripts) > limit:
+            scripts = scripts[:limit]
+            next_after_id = scripts[-1]["id"]
+            headers["X-Next-After-Id"] = str(next_after_id)
+            headers["Link"] = f'<{request.url.include_query_params(after_id=next_after_id)}>; rel="next"'
+    return StreamingResponse(stream_json_array(scripts), media_type="application/json", headers=headers)
 
-@app.get("/export_tampermonkey/{script_id}")
-def export_tampermonkey(script_id: int):
-    try:
-        scripts_file = get_scripts_file_path()
-        with open(scripts_file, 'r', encoding='utf-8') as f:
-            scripts = json.load(f)
-        
-        script = next((s for s in scripts if s["id"] == script_id), None)
-        if not script:
-            return {"error": "Script not found"}
-        
-        # Clean filename for cross-platform compatibility
-        safe_filename = "".join(c for c in script["prompt"] if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        safe_filename = safe_filename.replace(' ', '_')
-        
-        tampermonkey_script = f"""// ==UserScript==
-// @name         Auto-generated: {script["prompt"]}
+# Rendered userscripts per script id, dropped whenever the store reports a change to that id
+render_cache = ResponseCache(max_entries=int(os.environ.get("RENDER_CACHE_SIZE", "4096")), ttl_seconds=float("inf"))
+
+def invalidate_rendered(ids):
+    if ids is None:
+        render_cache.purge()
+    else:
+        for script_id in ids:
+            render_cache.discard(script_id)
+
+script_store.subscribe(invalidate_rendered)
+
+# Prompts of scripts users marked as working; a close enough rephrasing reuses that code instead
+# of running the model. Matches must share the parsed intent and color. Above 1 disables it.
+RETRIEVAL_THRESHOLD = float(os.environ.get("RETRIEVAL_THRESHOLD", "0.75"))
+retrieval_index = RetrievalIndex(
+    dim=int(os.environ.get("RETRIEVAL_DIM", "512")),
+    threshold=RETRIEVAL_THRESHOLD,
+    signature=parse_command,
+)
+
+def retrievable(script):
+    """Reported working and carrying real code (the generic fallback only echoes its prompt)"""
+    prompt, code = script.get("prompt"), script.get("code")
+    return bool(script.get("success") and prompt and code and code != generic_fallback_code(prompt))
+
+# Seconds between checks for scripts saved through other processes on the same database
+# (the other --workers); saves through this process are indexed right away
+RETRIEVAL_REFRESH_SECONDS = float(os.environ.get("RETRIEVAL_REFRESH_SECONDS", "2"))
+_retrieval_refresh_lock = threading.Lock()
+retrieval_indexed_id = None  # highest script id looked at so far; None until the first build
+
+def refresh_retrieval_index():
+    """Index the working scripts saved since the last refresh, by any process; returns how many"""
+    global retrieval_indexed_id
+    with _retrieval_refresh_lock:
+        last_id = retrieval_indexed_id or 0
+        items = []
+        for script in script_store.iter_scripts(after_id=last_id, success=True):
+            last_id = script["id"]
+            if retrievable(script):
+                items.append((script["prompt"], script["code"], script["id"]))
+        # add_many re-weights every row; a few new scripts are cheaper to add one by one
+        if len(items) > 64:
+            retrieval_index.add_many(items)
+        else:
+            for item in items:
+                retrieval_index.add(*item)
+        retrieval_indexed_id = last_id
+    return len(items)
+
+def follow_retrieval_index():
+    """Background loop: build the index, then pick up scripts other processes save"""
+    start = time.perf_counter()
+    version = script_store.version
+    refresh_retrieval_index()
+    logger.info("Indexed %d working scripts for retrieval in %.2fs", len(retrieval_index), time.perf_counter() - start)
+    while True:
+        time.sleep(RETRIEVAL_REFRESH_SECONDS)
+        # Cheap when nothing changed: the store only re-reads MAX(id) after a commit
+        if script_store.version != version:
+            version = script_store.version
+            refresh_retrieval_index()
+
+def index_saved_scripts(ids):
+    # Before the first build, that build picks the new scripts up
+    if RETRIEVAL_THRESHOLD <= 1 and retrieval_indexed_id is not None:
+        refresh_retrieval_index()
+
+script_store.subscribe(index_saved_scripts)
+
+def retrieval_response(prompt, key):
+    """The code of a working saved script whose prompt is close to this one, if any"""
+    if RETRIEVAL_THRESHOLD > 1 or not len(retrieval_index):
+        return None
+    start = time.perf_counter()
+    match = retrieval_index.lookup(prompt)
+    stage_seconds.observe(time.perf_counter() - start, "retrieval")
+    if match is None:
+        return None
+    logger.info("Reusing script %s (similarity %.2f) for: %s", match["script_id"], match["similarity"], prompt, extra=VERBOSE)
+    response = {"code": match["code"], "source": "retrieval", "prompt": prompt, "timestamp": datetime.now().isoformat(),
+                "similarity": match["similarity"], "script_id": match["script_id"]}
+    cache_response(key, response)
+    return response
+
+async def retrieval_responses(requests):
+    """retrieval_response for each (prompt, key), run off the event loop: a lookup scores every
+    saved prompt in its group and may wait on an index rebuild"""
+    if RETRIEVAL_THRESHOLD > 1 or not len(retrieval_index) or not requests:
+        return [None] * len(requests)
+    return await asyncio.to_thread(lambda: [retrieval_response(prompt, key) for prompt, key in requests])
+
+def render_tampermonkey(script):
+    """Render a saved script as (userscript, filename, combined_block), cached per script id"""
+    rendered = render_cache.get(script["id"])
+    if rendered is not None:
+        return rendered
+    
+    prompt = script["prompt"] or ""
+    # Clean filename for cross-platform compatibility
+    safe_filename = "".join(c for c in prompt if c.isalnum() or c in (' ', '-', '_')).rstrip()
+    safe_filename = safe_filename.replace(' ', '_')
+    
+    tampermonkey_script = f"""// ==UserScript==
+// @name         Auto-generated: {prompt}
 // @namespace    http://tampermonkey.net/
 // @version      1.0
 // @description  Generated by AI Browser Extension
@@ -289,67 +1082,406 @@ def export_tampermonkey(script_id: int):
 (function() {{
     'use strict';
     
-    // Generated code for: {script["prompt"]}
-    // Source: {script.get("source", "unknown")}
-    // Platform: {script.get("platform", "unknown")}
+    // Generated code for: {prompt}
+    // Source: {script.get("source") or "unknown"}
+    // Platform: {script.get("platform") or "unknown"}
     {script["code"]}
     
-    console.log('Tampermonkey script executed: {script["prompt"]}');
+    console.log('Tampermonkey script executed: {prompt}');
 }})();"""
+    
+    # Same body as its own IIFE, for the combined userscript
+    combined_block = f"""
+// Script #{script["id"]}: {prompt}
+(function() {{
+    'use strict';
+    
+    // Source: {script.get("source") or "unknown"}
+    // Platform: {script.get("platform") or "unknown"}
+    {script["code"]}
+}})();
+"""
+    rendered = (tampermonkey_script, f"script_{script['id']}_{safe_filename}.user.js", combined_block)
+    render_cache.put(script["id"], rendered)
+    return rendered
+
+@app.get("/export_tampermonkey/{script_id}")
+def export_tampermonkey(script_id: int):
+    try:
+        script = script_store.get(script_id)
+        if not script:
+            return {"error": "Script not found"}
         
+        tampermonkey_script, filename, _ = render_tampermonkey(script)
         return {
             "tampermonkey_script": tampermonkey_script,
-            "filename": f"script_{script_id}_{safe_filename}.user.js"
+            "filename": filename
         }
     except Exception as e:
         return {"error": str(e)}
 
+class _ZipStreamSink:
+    """Write-only file object for zipfile; hands out what was written since the last drain"""
+    
+    def __init__(self):
+        self._chunks = []
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def stream_tampermonkey_zip(scripts):
+    """Yield a zip of .user.js files as it is written; only one file is held in memory at a time"""
+    sink = _ZipStreamSink()
+    # A sink without seek/tell makes zipfile write data descriptors instead of seeking back
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for script in scripts:
+            tampermonkey_script, filename, _ = render_tampermonkey(script)
+            archive.writestr(filename, tampermonkey_script)
+            yield sink.drain()
+    yield sink.drain()
+
+def stream_combined_userscript(scripts):
+    """Yield one userscript that runs every selected script"""
+    yield """// ==UserScript==
+// @name         Auto-generated: combined export
+// @namespace    http://tampermonkey.net/
+// @version      1.0
+// @description  Generated by AI Browser Extension
+// @author       You
+// @match        *://*/*
+// @grant        none
+// ==/UserScript==
+"""
+    for script in scripts:
+        yield render_tampermonkey(script)[2]
+
+class BulkExportRequest(BaseModel):
+    """Body of /export_tampermonkey_bulk; bad values get a 422 like the /get_saved_scripts query"""
+    ids: Optional[List[int]] = None
+    url: Optional[str] = None
+    source: Optional[str] = None
+    success: Optional[bool] = None
+    since: Optional[str] = None
+    until: Optional[str] = None
+    format: Literal["zip", "combined"] = "zip"
+
+    @field_validator("since", "until")
+    @classmethod
+    def iso_timestamp(cls, value):
+        # Kept as given: saved timestamps are ISO strings and are compared as strings
+        if value is not None:
+            datetime.fromisoformat(value)
+        return value
+
+@app.post("/export_tampermonkey_bulk")
+def export_tampermonkey_bulk(export_request: BulkExportRequest):
+    """Export many scripts as a streamed zip of .user.js files or one combined userscript.
+    
+    Body: {"ids": [...]} or filters {"url", "source", "success", "since", "until"}, plus
+    "format": "zip" (default) or "combined".
+    """
+    if export_request.ids is not None:
+        scripts = script_store.get_many(export_request.ids)
+    else:
+        scripts = script_store.iter_scripts(**export_request.model_dump(include={"url", "source", "success", "since", "until"}))
+    
+    if export_request.format == "combined":
+        return StreamingResponse(
+            stream_combined_userscript(scripts),
+            media_type="text/javascript",
+            headers={"Content-Disposition": 'attachment; filename="combined_scripts.user.js"'},
+        )
+    return StreamingResponse(
+        stream_tampermonkey_zip(scripts),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="tampermonkey_scripts.zip"'},
+    )
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving (fallback works without the model)"""
+    return {"status": "ok", "model_status": model_state["status"]}
+
+@app.get("/readyz")
+def readyz(require_model: bool = Query(False)):
+    """Readiness with model load state; pass require_model=true to get 503 until the model is ready"""
+    ready = model_state["status"] == "ready" or not require_model
+    body = {"ready": ready, **model_state}
+    return JSONResponse(content=body, status_code=200 if ready else 503)
+
+@app.get("/inference_stats")
+def get_inference_stats():
+    """Micro-batching and inference executor metrics: batch sizes, queue wait and depth, decode steps"""
+    if INFERENCE_SERVER:
+        remote = inference_model_stats or {}
+        return {**batcher.stats(), "early_stopping": remote.get("early_stopping"), "prompt_cache": remote.get("prompt_cache")}
+    prompt_cache = getattr(generator, "prompt_cache", None)
+    return {**batcher.stats(), "early_stopping": get_decode_stats(),
+            "prompt_cache": prompt_cache.stats() if prompt_cache is not None else None}
+
+def _model_status():
+    return {(model_state["status"],): 1}
+
+metrics.gauge_callback("model_status", "Current model load state", _model_status, ("status",))
+model_metrics.gauge_callback("model_idle_seconds", "Seconds since the loaded model last generated", lambda: round(time.monotonic() - model_last_used, 1) if generator is not None else None)
+metrics.gauge_callback("model_load_seconds", "Time taken to load the model pipeline", lambda: model_state["load_seconds"])
+metrics.gauge_callback("inference_queue_depth", "Prompts waiting for an inference slot", lambda: batcher.queue_depth())
+metrics.gauge_callback("inference_running_batches", "Batches currently running on the inference executor", lambda: batcher.stats()["running_batches"])
+metrics.counter_callback("inference_batches_total", "Batched generate calls", lambda: batcher.stats()["batches"])
+metrics.counter_callback("inference_requests_total", "Prompts sent to the model", lambda: batcher.stats()["requests"])
+metrics.counter_callback("inference_rejected_total", "Prompts rejected because the inference queue was full", lambda: batcher.stats()["rejected"])
+model_metrics.counter_callback("inference_decode_steps_total", "Tokens decoded by the model", lambda: get_decode_stats()["decode_steps"])
+model_metrics.counter_callback("inference_decode_steps_saved_total", "Tokens not decoded thanks to early stopping", lambda: get_decode_stats()["decode_steps_saved"])
+model_metrics.counter_callback("inference_cancelled_total", "Generations stopped because the client closed the stream", lambda: get_decode_stats()["cancelled"])
+model_metrics.counter_callback("prompt_cache_hits_total", "Prompts generated from precomputed prompt state", lambda: getattr(getattr(generator, "prompt_cache", None), "hits", None))
+model_metrics.counter_callback("prompt_cache_misses_total", "Prompts that went through the pipeline because they were not precomputed", lambda: getattr(getattr(generator, "prompt_cache", None), "misses", None))
+metrics.gauge_callback("response_cache_entries", "Entries in the /generate response cache", lambda: len(response_cache))
+metrics.counter_callback("response_cache_hits_total", "Response cache hits", lambda: response_cache.hits)
+metrics.counter_callback("response_cache_misses_total", "Response cache misses", lambda: response_cache.misses)
+metrics.gauge_callback("render_cache_entries", "Rendered userscripts in the export cache", lambda: len(render_cache))
+metrics.gauge_callback("retrieval_index_entries", "Working script prompts in the retrieval index", lambda: len(retrieval_index))
+metrics.gauge_callback("saved_scripts", "Scripts in the script store", lambda: script_store.count())
+metrics.counter_callback("log_records_dropped_total", "Log records dropped because the log queue was full", dropped_records)
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus text-format metrics: per-stage latency, response sources, fallback reasons, queue and store sizes"""
+    if INFERENCE_SERVER:
+        # As of the last status poll of the inference process
+        model_series = (inference_model_stats or {}).get("metrics", "")
+    else:
+        model_series = model_metrics.render()
+    return Response(content=metrics.render() + model_series, media_type=METRICS_CONTENT_TYPE)
+
+def model_process_stats():
+    """What only the process running the model records, sent to the workers of a shared inference process"""
+    prompt_cache = getattr(generator, "prompt_cache", None)
+    return {"metrics": model_metrics.render(), "early_stopping": get_decode_stats(),
+            "prompt_cache": prompt_cache.stats() if prompt_cache is not None else None}
+
+@app.get("/cache_stats")
+def get_cache_stats():
+    """Response cache hit/miss counters"""
+    return response_cache.stats()
+
+@app.post("/purge_cache")
+def purge_cache():
+    removed = response_cache.purge()
+    logger.info("Purged %d cached responses", removed)
+    return {"message": "Cache purged", "removed": removed}
+
+# Without ADMIN_TOKEN, /admin only answers local tools like curl: the server listens on every
+# interface, and a web page open in a local browser can still send simple cross-origin POSTs
+_LOOPBACK_HOSTS = ("127.0.0.1", "::1", "localhost")
+
+def require_admin(request):
+    if ADMIN_TOKEN:
+        if not hmac.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+            raise HTTPException(status_code=403, detail="Admin token required")
+        return
+    if request.client is None or request.client.host not in _LOOPBACK_HOSTS or "origin" in request.headers:
+        raise HTTPException(status_code=403, detail="Set ADMIN_TOKEN to use /admin from other hosts or from a browser")
+
+@app.get("/admin/models")
+async def list_models(request: Request):
+    """Registered models, the one serving and the progress of the last swap"""
+    require_admin(request)
+    state = model_state
+    client = inference_client
+    if client is not None:
+        # The shared inference process owns the model; asking it is a blocking round trip
+        state = await asyncio.to_thread(client.status)
+    return {
+        "current": state.get("model_id"),
+        "status": state.get("status"),
+        "swap": state.get("swap"),
+        "idle_timeout": MODEL_IDLE_TIMEOUT,
+        "models": [spec._asdict() for spec in MODEL_REGISTRY.values()],
+    }
+
+@app.post("/admin/models/load")
+async def admin_load_model(load_request: dict, request: Request):
+    """Load a registered model in the background, quality-test it and swap it in.
+
+    Body: {"model": "<id>"}. The current model keeps serving until the new one is ready;
+    if the new one fails to load or fails the quality gate, the current one stays.
+    Follow progress on GET /admin/models.
+    """
+    require_admin(request)
+    model_id = load_request.get("model")
+    if model_id not in MODEL_REGISTRY:
+        raise HTTPException(status_code=404, detail=f"Unknown model {model_id!r}; see GET /admin/models")
+    if INFERENCE_SERVER:
+        client = inference_client
+        if client is None:
+            raise HTTPException(status_code=503, detail="Not connected to the inference server yet")
+        started = await asyncio.to_thread(client.load_model, model_id)
+    else:
+        started = start_model_load(model_id)
+    if not started:
+        raise HTTPException(status_code=409, detail="A model is already loading")
+    logger.info("Loading model %s on admin request", model_id)
+    return JSONResponse(content={"message": "Loading model", "model": model_id}, status_code=202)
+
+@app.post("/admin/models/unload")
+def admin_unload_model(request: Request):
+    """Unload the model now; the next request that needs it loads it again"""
+    require_admin(request)
+    if INFERENCE_SERVER:
+        raise HTTPException(status_code=400, detail="The shared inference process unloads on MODEL_IDLE_TIMEOUT only")
+    return {"unloaded": unload_model("admin")}
+
 # Add system info endpoint
 @app.get("/system_info")
 def get_system_info():
-    return {
+    info = {
         "platform": platform.system(),
         "machine": platform.machine(),
         "python_version": platform.python_version(),
-        "device": device,
-        "torch_version": torch.__version__,
-        "cuda_available": torch.cuda.is_available(),
-        "mps_available": hasattr(torch.backends, 'mps') and torch.backends.mps.is_available() if platform.system() == "Darwin" else False
+        "device": model_state["device"],
+        "inference_mode": model_state["inference_mode"],
     }
+    # Workers of a shared inference process do not import torch
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        info.update({
+            "torch_threads": torch.get_num_threads(),
+            "torch_interop_threads": torch.get_num_interop_threads(),
+            "torch_version": torch.__version__,
+            "cuda_available": torch.cuda.is_available(),
+            "mps_available": hasattr(torch.backends, 'mps') and torch.backends.mps.is_available() if platform.system() == "Darwin" else False
+        })
+    return info
 
-def test_model_quality(generator, test_prompts):
-    """Test if model actually generates useful JavaScript"""
-    if generator is None:
-        return False
-    
-    test_cases = [
-        "document.querySelector('button').style.backgroundColor = 'red'",
-        "document.body.style.fontSize = '20px'",
-        "document.querySelectorAll('img').forEach(img => img.style.display = 'none'"
-    ]
-    
+DEFAULT_QUALITY_TEST_CASES = [
+    "document.querySelector('button').style.backgroundColor = 'red'",
+    "document.body.style.fontSize = '20px'",
+    "document.querySelectorAll('img').forEach(img => img.style.display = 'none'"
+]
+
+def load_quality_test_cases():
+    """Test prompts for the quality gate; QUALITY_TEST_CASES_FILE may point to a JSON list"""
+    path = os.environ.get("QUALITY_TEST_CASES_FILE")
+    if not path:
+        return list(DEFAULT_QUALITY_TEST_CASES)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+QUALITY_TEST_CASES = load_quality_test_cases()
+QUALITY_THRESHOLD = float(os.environ.get("QUALITY_THRESHOLD", "0.5"))  # success rate must exceed this
+
+def run_quality_probe(generator, test_cases=None, threshold=None):
+    """Run the quality test cases; returns the verdict with per-case output and timings"""
+    test_cases = QUALITY_TEST_CASES if test_cases is None else test_cases
+    threshold = QUALITY_THRESHOLD if threshold is None else threshold
+    results = []
     success_count = 0
+    probe_start = time.perf_counter()
     for prompt in test_cases:
+        start = time.perf_counter()
+        output = ""
+        passed = False
+        error = None
         try:
             result = generator(prompt, max_new_tokens=20, do_sample=False)
             output = result[0]['generated_text'].replace(prompt, "").strip()
             
             # Check if completion makes sense
-            if (output and 
+            passed = bool(output and 
                 len(output) > 2 and 
                 not any(bad in output.lower() for bad in ['import', 'def ', 'class ', 'apache', 'license']) and
-                any(good in output.lower() for good in [';', ')', '}', "'"])):
+                any(good in output.lower() for good in [';', ')', '}', "'"]))
+            if passed:
                 success_count += 1
-                print(f"✅ Test passed: {prompt} → {output[:30]}...")
+                logger.info("✅ Test passed: %s → %s...", prompt, output[:30])
             else:
-                print(f"❌ Test failed: {prompt} → {output[:30]}...")
+                logger.info("❌ Test failed: %s → %s...", prompt, output[:30])
                 
         except Exception as e:
-            print(f"❌ Test error: {e}")
+            error = str(e)
+            logger.warning("❌ Test error: %s", e)
+        results.append({"prompt": prompt, "output": output, "passed": passed, "error": error,
+                        "seconds": round(time.perf_counter() - start, 3)})
     
-    success_rate = success_count / len(test_cases)
-    print(f"Model quality: {success_rate:.1%} success rate")
-    return success_rate > 0.5  # Require >50% success
+    success_rate = success_count / len(test_cases) if test_cases else 0.0
+    logger.info("Model quality: %.1f%% success rate", success_rate * 100)
+    return {
+        "passed": success_rate > threshold,
+        "success_rate": success_rate,
+        "threshold": threshold,
+        "cases": results,
+        "seconds": round(time.perf_counter() - probe_start, 3),
+        "checked_at": datetime.now().isoformat(),
+    }
+
+def test_model_quality(generator, test_prompts=None):
+    """Test if model actually generates useful JavaScript"""
+    if generator is None:
+        return False
+    return run_quality_probe(generator, test_prompts)["passed"]
+
+# Persisted quality verdicts, so restarts with the same model skip the probe
+def get_quality_verdicts_path():
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.environ.get("QUALITY_VERDICT_FILE", os.path.join(current_dir, "model_quality.json"))
+
+_quality_verdicts_lock = threading.Lock()
+
+def quality_verdict_key(model_name, revision, model_device, test_cases):
+    # Changing the test cases invalidates old verdicts; the threshold is re-applied on read
+    cases_hash = hashlib.sha256(json.dumps(test_cases).encode('utf-8')).hexdigest()[:12]
+    return f"{model_name}@{revision}|{model_device}|{cases_hash}"
+
+def load_quality_verdict(key):
+    with _quality_verdicts_lock:
+        try:
+            with open(get_quality_verdicts_path(), 'r', encoding='utf-8') as f:
+                return json.load(f).get(key)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+def save_quality_verdict(key, verdict):
+    path = get_quality_verdicts_path()
+    with _quality_verdicts_lock:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                verdicts = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            verdicts = {}
+        verdicts[key] = verdict
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(verdicts, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+def check_model_quality(loaded, model_name, model_device):
+    """Quality gate run during warmup: reuse a persisted verdict or probe the model and persist it"""
+    revision = getattr(loaded.model.config, "_commit_hash", None)
+    key = quality_verdict_key(model_name, revision, model_device, QUALITY_TEST_CASES)
+    verdict = load_quality_verdict(key) if revision else None
+    if verdict is not None:
+        verdict = {**verdict, "passed": verdict["success_rate"] > QUALITY_THRESHOLD,
+                   "threshold": QUALITY_THRESHOLD, "cached": True}
+        logger.info("Using saved quality verdict for %s: %.1f%% success rate", key, verdict["success_rate"] * 100)
+        return verdict
+    verdict = run_quality_probe(loaded)
+    # Without a revision (e.g. a local model directory) the weights could change under the same name.
+    # A case that errored (out of memory, a transient failure) says nothing lasting about the model.
+    errors = sum(case["error"] is not None for case in verdict["cases"])
+    if errors:
+        logger.warning("Not saving the quality verdict for %s: %d test case(s) errored", key, errors)
+    elif revision:
+        save_quality_verdict(key, verdict)
+    return {**verdict, "cached": False}
 
 # Add this alternative to AI models:
 
@@ -524,5 +1656,19 @@ def create_test_page():
 
 if __name__ == "__main__":
     import uvicorn
-    print(f"Starting server on {platform.system()} with device: {device}")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    args = CLI_ARGS
+    if not LAUNCHER:
+        logger.info("Starting server on %s with device: %s", platform.system(), device)
+    if args.workers <= 1:
+        uvicorn.run(app, host="0.0.0.0", port=args.port)
+    else:
+        # One model in one inference process; the workers are plain HTTP processes talking to it
+        server_process, address, authkey = start_inference_server()
+        os.environ["INFERENCE_SERVER"] = address
+        os.environ["INFERENCE_SERVER_AUTHKEY"] = authkey
+        logger.info("Starting %d HTTP workers sharing the inference server at %s", args.workers, address)
+        try:
+            uvicorn.run("app:app", host="0.0.0.0", port=args.port, workers=args.workers)
+        finally:
+            server_process.terminate()
+            server_process.wait()
@@ -0,0 +1,91 @@
+"""Compare CPU inference modes: latency, peak RSS and quality gate pass rate.
+
+Each mode runs in a fresh subprocess so peak RSS is measured per mode. Needs the real model
+(or any text-generation model via --model) to be available locally or downloadable.
+
+Usage: python benchmarks/bench_cpu_modes.py [--modes fp32,int8,bf16] [--model NAME] [--repeats 5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import peak_rss_mb, summarize
+
+PROMPTS = ["make buttons blue", "change background to red", "hide images", "hide buttons", "make text bold"]
+
+
+def run_mode(mode, model_name, repeats):
+    os.environ["CPU_INFERENCE_MODE"] = mode
+    # Keep app.py away from the real scripts database and saved quality verdicts
+    tmp = tempfile.mkdtemp(prefix="bench-cpu-modes-")
+    os.environ["SCRIPTS_DB_PATH"] = os.path.join(tmp, "scripts.db")
+    os.environ["QUALITY_VERDICT_FILE"] = os.path.join(tmp, "model_quality.json")
+    import app
+    import torch
+    from intents import enhance_prompt_for_codet5
+    from transformers import pipeline
+
+    start = time.perf_counter()
+    loaded = pipeline("text-generation", model=model_name, device="cpu", max_length=512)
+    applied = app.apply_cpu_inference_mode(loaded, mode)
+    load_seconds = time.perf_counter() - start
+
+    quality = app.run_quality_probe(loaded)
+    # Greedy decoding so every mode generates comparable outputs
+    params = {**app.GENERATION_PARAMS, "do_sample": False}
+    loaded(enhance_prompt_for_codet5(PROMPTS[0]), **params)  # warm-up
+    latencies = []
+    for _ in range(repeats):
+        for prompt in PROMPTS:
+            enhanced = enhance_prompt_for_codet5(prompt)
+            t = time.perf_counter()
+            loaded(enhanced, **params)
+            latencies.append(time.perf_counter() - t)
+    return {
+        "requested_mode": mode,
+        "applied_mode": applied,
+        "quantized_layers": getattr(loaded, "quantized_layers", None),
+        "load_seconds": round(load_seconds, 2),
+        **summarize(latencies),
+        "peak_rss_mb": peak_rss_mb(),
+        "quality_pass_rate": quality["success_rate"],
+        "quality_passed": quality["passed"],
+        "torch_threads": torch.get_num_threads(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="fp32,int8,bf16")
+    parser.add_argument("--model", default=os.environ.get("MODEL_NAME", "Salesforce/codet5p-770m"))
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_mode(args.worker, args.model, args.repeats)
+        # Flush the app's queued log lines first: the parent reads the last stdout line
+        from log_setup import stop_logging
+        stop_logging()
+        print(json.dumps(result))
+        return
+
+    report = {"model": args.model, "modes": {}}
+    for mode in args.modes.split(","):
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", mode, "--model", args.model, "--repeats", str(args.repeats)],
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            report["modes"][mode] = {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"}
+            continue
+        report["modes"][mode] = json.loads(proc.stdout.strip().splitlines()[-1])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
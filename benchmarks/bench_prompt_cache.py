@@ -0,0 +1,89 @@
+"""Per-request generation latency with and without the prompt cache (prompt_cache.py).
+
+Runs the server's batched generation path (app.run_generator_batch, including early
+stopping) on enhanced prompts, alternating between the pipeline and the precomputed
+prompt state so both see the same load. Decoding is greedy so outputs can be compared.
+Needs the real model (or any text-generation model via --model) locally or downloadable.
+
+Usage: python benchmarks/bench_prompt_cache.py [--model NAME] [--batch-sizes 1,4] [--repeats 20]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from common import peak_rss_mb, summarize
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+COMMANDS = ["make buttons blue", "change background to red", "hide images", "hide buttons", "make text bold",
+            "make the buttons pink", "set background to green", "paint buttons orange"]
+
+
+def run(model_name, batch_sizes, repeats, seed):
+    import app
+    from intents import enhance_prompt_for_codet5, model_prompts
+    from prompt_cache import PromptCache
+    from transformers import pipeline
+
+    loaded = pipeline("text-generation", model=model_name, device="cpu", max_length=512)
+    if loaded.tokenizer.pad_token_id is None:
+        loaded.tokenizer.pad_token_id = loaded.tokenizer.eos_token_id
+    if not loaded.model.config.is_encoder_decoder:
+        loaded.tokenizer.padding_side = "left"
+    cache = PromptCache(loaded)
+    cache.warm(model_prompts())
+    app.generator = loaded
+    params = {**app.GENERATION_PARAMS, "do_sample": False}
+
+    def generate(prompts, cached):
+        loaded.prompt_cache = cache if cached else None
+        start = time.perf_counter()
+        results = app.run_generator_batch(prompts, params)
+        return time.perf_counter() - start, [result[0]["generated_text"] for result in results]
+
+    rng = random.Random(seed)
+    report = {"model": model_name, "cached_prompts": len(cache), "warm_seconds": cache.warm_seconds, "batch_sizes": {}}
+    for batch_size in batch_sizes:
+        generate([enhance_prompt_for_codet5(COMMANDS[0])] * batch_size, False)  # warm-up
+        generate([enhance_prompt_for_codet5(COMMANDS[0])] * batch_size, True)
+        latencies = {False: [], True: []}
+        identical = 0
+        for i in range(repeats):
+            prompts = [enhance_prompt_for_codet5(rng.choice(COMMANDS)) for _ in range(batch_size)]
+            outputs = {}
+            # Alternate which one goes first so neither always runs on a warmer cache
+            for cached in ((False, True) if i % 2 else (True, False)):
+                seconds, outputs[cached] = generate(prompts, cached)
+                latencies[cached].append(seconds)
+            identical += outputs[False] == outputs[True]
+        without, with_cache = summarize(latencies[False]), summarize(latencies[True])
+        report["batch_sizes"][batch_size] = {
+            "pipeline": without,
+            "prompt_cache": with_cache,
+            "p50_speedup": round(without["p50_ms"] / with_cache["p50_ms"], 3),
+            "identical_outputs": round(identical / repeats, 3),
+        }
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.environ.get("MODEL_NAME", "Salesforce/codet5p-770m"))
+    parser.add_argument("--batch-sizes", default="1,4")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    tmp = tempfile.mkdtemp(prefix="bench-prompt-cache-")
+    os.environ.setdefault("SCRIPTS_DB_PATH", os.path.join(tmp, "scripts.db"))
+    report = run(args.model, [int(size) for size in args.batch_sizes.split(",")], args.repeats, args.seed)
+    from log_setup import stop_logging
+    stop_logging()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Build time, lookup latency and memory of the retrieval index as it grows.
+
+Indexes synthetic, distinct prompts (random targets, colors and filler) and reports the full
+rebuild time, per-entry incremental add latency and lookup latency (hits and misses).
+
+Usage:
+  python benchmarks/bench_retrieval.py --sizes 1000,10000,100000
+"""
+import argparse
+import json
+import random
+import time
+
+from common import current_rss_mb, summarize
+
+from intents import extract_color, parse_command
+from retrieval import RetrievalIndex
+
+TARGETS = ["links", "buttons", "images", "headings", "paragraphs", "tables", "sidebar", "header", "footer",
+           "videos", "ads", "comments", "menu", "forms", "inputs", "lists", "quotes", "code blocks", "banners"]
+ACTIONS = ["make {t} {c}", "hide the {t}", "show all {t}", "underline every {t}", "make {t} bigger",
+           "give {t} a {c} border", "round the corners of {t}", "add a shadow to the {t}", "make {t} blink"]
+COLORS = ["red", "blue", "green", "yellow", "purple", "orange", "pink", "black", "white", "gray"]
+WORDS = ["alpha", "bravo", "delta", "echo", "kilo", "lima", "nova", "oscar", "sierra", "tango", "zulu"]
+
+
+def signature(prompt):
+    return parse_command(prompt)[0], extract_color(prompt)
+
+
+def synthetic_prompt(rng, i):
+    action = rng.choice(ACTIONS).format(t=rng.choice(TARGETS), c=rng.choice(COLORS))
+    # A unique tag keeps every prompt distinct, like a real history of varied commands
+    return f"{action} in the {rng.choice(WORDS)} section {i}"
+
+
+def bench_size(size, lookups, adds, seed):
+    rng = random.Random(seed)
+    prompts = [synthetic_prompt(rng, i) for i in range(size)]
+    index = RetrievalIndex(signature=signature)
+    rss_before = current_rss_mb()
+
+    start = time.perf_counter()
+    index.add_many((prompt, "code", i) for i, prompt in enumerate(prompts))
+    build_seconds = time.perf_counter() - start
+    index_rss_mb = round(current_rss_mb() - rss_before, 1)
+
+    hit_times, miss_times, hits = [], [], 0
+    for i in range(lookups):
+        # Rephrase a stored prompt (drop filler, change case) for hits; invent one for misses
+        query = prompts[rng.randrange(size)].replace(" the ", " ").upper()
+        t = time.perf_counter()
+        hits += index.lookup(query) is not None
+        hit_times.append(time.perf_counter() - t)
+        t = time.perf_counter()
+        index.lookup(f"translate the page into {rng.choice(WORDS)} {i}")
+        miss_times.append(time.perf_counter() - t)
+
+    add_times = []
+    for i in range(adds):
+        t = time.perf_counter()
+        index.add(synthetic_prompt(rng, size + i), "code", size + i)
+        add_times.append(time.perf_counter() - t)
+
+    return {
+        "entries": len(index),
+        "build_seconds": round(build_seconds, 3),
+        "index_rss_mb": index_rss_mb,
+        "lookup_hit": summarize(hit_times),
+        "lookup_miss": summarize(miss_times),
+        "hit_rate": round(hits / lookups, 3),
+        "incremental_add": summarize(add_times),
+        **{k: v for k, v in index.stats().items() if k in ("vectors_mb", "rebuilds")},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--adds", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    report = {size: bench_size(size, args.lookups, args.adds, args.seed) for size in map(int, args.sizes.split(","))}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
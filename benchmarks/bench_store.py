@@ -0,0 +1,94 @@
+"""Save latency of the script store as it grows.
+
+Fills a temporary store to each checkpoint size and times individual saves there, for the
+SQLite store and (up to --legacy-max) the old rewrite-the-whole-JSON-file approach.
+
+Usage: python benchmarks/bench_store.py [--sizes 0,1000,10000,100000,200000] [--samples 200]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from common import summarize
+
+from script_store import ScriptStore
+
+
+def make_entry(i):
+    return {
+        "prompt": f"make buttons blue {i}",
+        "code": "document.querySelectorAll('button').forEach(btn => btn.style.backgroundColor = 'blue');",
+        "source": "fallback",
+        "success": True,
+        "timestamp": "2026-01-01T00:00:00",
+        "url": f"https://example.com/page/{i % 500}",
+        "platform": "Linux",
+    }
+
+
+def bench_sqlite(sizes, samples):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ScriptStore(os.path.join(tmp, "scripts.db"))
+        filled = 0
+        for size in sizes:
+            # Bulk-fill to the checkpoint in one transaction so setup stays quick
+            store._conn.execute("BEGIN")
+            store._conn.executemany(
+                "INSERT INTO scripts (prompt, code, source, success, timestamp, url, platform) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (ScriptStore._row_values(make_entry(i)) for i in range(filled, size)),
+            )
+            store._conn.execute("COMMIT")
+            filled = max(filled, size)
+            timings = []
+            for i in range(samples):
+                start = time.perf_counter()
+                store.add(make_entry(filled + i))
+                timings.append(time.perf_counter() - start)
+            filled += samples
+            results.append({"store_size": size, **summarize(timings)})
+        store.close()
+    return results
+
+
+def bench_legacy_json(sizes, samples):
+    """The pre-SQLite save: load the whole file, append, rewrite with indent=2"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "working_scripts.json")
+        for size in sizes:
+            scripts = [{"id": i + 1, **make_entry(i)} for i in range(size)]
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(scripts, f, indent=2, ensure_ascii=False)
+            timings = []
+            for i in range(samples):
+                start = time.perf_counter()
+                with open(path, 'r', encoding='utf-8') as f:
+                    scripts = json.load(f)
+                scripts.append({"id": len(scripts) + 1, **make_entry(size + i)})
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(scripts, f, indent=2, ensure_ascii=False)
+                timings.append(time.perf_counter() - start)
+            results.append({"store_size": size, **summarize(timings)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="0,1000,10000,100000,200000")
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--legacy-max", type=int, default=10000, help="largest size to run the JSON baseline at")
+    args = parser.parse_args()
+    sizes = sorted(int(s) for s in args.sizes.split(","))
+
+    report = {
+        "sqlite": bench_sqlite(sizes, args.samples),
+        "legacy_json": bench_legacy_json([s for s in sizes if s <= args.legacy_max], max(1, args.samples // 10)),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Throughput and memory of multi-worker serving as the HTTP worker count grows.
+
+For each worker count, starts `python app.py --workers N` (the launcher, which starts one shared
+inference process and N HTTP workers), drives /generate over HTTP with concurrent clients and
+reports throughput, latency and the memory (RSS and PSS) of the launcher, the inference process
+and the workers. With one worker, `python app.py` serves by itself, so the benchmark starts the
+inference process and `uvicorn app:app` directly. A stub stands in for the model unless
+--real-model is given; with --real-model, --per-worker also measures the old layout where
+every worker loads its own copy.
+
+Usage:
+  python benchmarks/bench_workers.py --workers 1,2,4 --requests 400 --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT, process_memory_mb, summarize, tree_memory_mb
+
+from inference_server import start_inference_server
+
+PROMPTS = ["make buttons blue", "hide images", "make background yellow", "make buttons purple",
+           "hide buttons", "make background green", "make buttons red", "make background pink"]
+
+
+async def wait_ready(base_url, workers, timeout):
+    import httpx
+
+    # Requests land on arbitrary workers; several ready answers in a row means they all are
+    needed = workers * 4
+    deadline = time.time() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        streak = 0
+        while streak < needed:
+            if time.time() > deadline:
+                raise SystemExit(f"Workers were not ready within {timeout}s")
+            try:
+                response = await client.get("/readyz", params={"require_model": "true"})
+                streak = streak + 1 if response.status_code == 200 else 0
+            except httpx.TransportError:
+                streak = 0
+            if streak < needed:
+                await asyncio.sleep(0.2 if streak == 0 else 0)
+
+
+async def drive(base_url, concurrency, total):
+    import httpx
+
+    limiter = asyncio.Semaphore(concurrency)
+    latencies = []
+    sources = {}
+
+    async def one(client, i):
+        async with limiter:
+            t = time.perf_counter()
+            response = await client.get("/generate", params={"prompt": PROMPTS[i % len(PROMPTS)], "deadline_ms": 0})
+            latencies.append(time.perf_counter() - t)
+            source = response.json().get("source", str(response.status_code))
+            sources[source] = sources.get(source, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client, i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+    return {**summarize(latencies, elapsed), "sources": sources}
+
+
+def child_pids(pid):
+    """Direct children of a process, by command line (Linux /proc)"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            if ppid == pid:
+                with open(f"/proc/{entry}/cmdline") as f:
+                    children[int(entry)] = f.read().replace("\0", " ")
+        except (OSError, ValueError, IndexError):
+            continue
+    return children
+
+
+def run_layout(args, workers, shared, tmp, port):
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join([ROOT, os.path.join(ROOT, "benchmarks")]),
+        "SCRIPTS_DB_PATH": os.path.join(tmp, f"scripts-{workers}-{port}.db"),
+        "QUALITY_VERDICT_FILE": os.path.join(tmp, "model_quality.json"),
+        "RESPONSE_CACHE_SIZE": "0",
+        "LOG_LEVEL": "WARNING",
+    }
+    env.pop("INFERENCE_SERVER", None)
+    if shared and not args.real_model:
+        env["INFERENCE_GENERATOR"] = "stub_generator:StubGenerator"
+    server = None
+    if shared and workers > 1:
+        # What people run: the launcher starts the inference process and the HTTP workers itself
+        command = [sys.executable, "app.py", "--workers", str(workers), "--port", str(port)]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--workers", str(workers),
+                   "--log-level", "warning"]
+        if shared:
+            # `python app.py` serves a single worker itself, so start its inference process here
+            server, address, authkey = start_inference_server(os.path.join(tmp, f"inference-{port}.sock"), env=env)
+            env.update(INFERENCE_SERVER=address, INFERENCE_SERVER_AUTHKEY=authkey)
+    web = subprocess.Popen(command, cwd=ROOT, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        asyncio.run(wait_ready(base_url, workers, args.ready_timeout))
+        result = asyncio.run(drive(base_url, args.concurrency, args.requests))
+        total = tree_memory_mb(web.pid)
+        memory = {"launcher": {"rss": 0.0, "pss": 0.0}, "inference": {"rss": 0.0, "pss": 0.0}}
+        if server is not None:
+            memory["inference"] = tree_memory_mb(server.pid)
+            total = {key: total[key] + memory["inference"][key] for key in total}
+        elif shared:
+            memory["launcher"] = process_memory_mb(web.pid)
+            for pid, cmdline in child_pids(web.pid).items():
+                if "inference_server" in cmdline:
+                    memory["inference"] = tree_memory_mb(pid)
+        memory["workers"] = {key: round(total[key] - memory["launcher"][key] - memory["inference"][key], 1)
+                             for key in total}
+        memory["total_pss"] = total["pss"]
+        result["memory_mb"] = memory
+        return result
+    finally:
+        for process in (web, server):
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--real-model", action="store_true", help="load MODEL_NAME in the inference process")
+    parser.add_argument("--per-worker", action="store_true", help="also run every worker with its own model (needs --real-model)")
+    parser.add_argument("--ready-timeout", type=float, default=600.0)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    report = {"model": os.environ.get("MODEL_NAME", "Salesforce/codet5p-770m") if args.real_model else "stub",
+              "requests": args.requests, "concurrency": args.concurrency, "shared": {}, "per_worker": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        for n, workers in enumerate(int(w) for w in args.workers.split(",")):
+            report["shared"][workers] = run_layout(args, workers, True, tmp, args.port + 2 * n)
+            if args.per_worker and args.real_model:
+                report["per_worker"][workers] = run_layout(args, workers, False, tmp, args.port + 2 * n + 1)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
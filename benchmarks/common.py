@@ -0,0 +1,91 @@
+"""Shared helpers for the benchmark scripts: latency summaries and process memory."""
+import os
+import platform
+import resource
+import statistics
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def percentile(sorted_samples, fraction):
+    return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * fraction))]
+
+
+def summarize(samples, elapsed=None):
+    """p50/p95/p99/mean in milliseconds, plus throughput when the wall-clock time is given"""
+    samples = sorted(samples)
+    summary = {
+        "count": len(samples),
+        "p50_ms": round(statistics.median(samples) * 1000, 4),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 4),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 4),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 4),
+    }
+    if elapsed:
+        summary["throughput_per_s"] = round(len(samples) / elapsed, 1)
+    return summary
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return round(peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024, 1)
+
+
+def current_rss_mb():
+    """Resident set size right now (Linux /proc; falls back to the peak elsewhere)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+
+def tree_memory_mb(root_pid):
+    """RSS and PSS of a process and all of its descendants (Linux /proc).
+
+    Summed RSS counts shared pages (torch's libraries, copy-on-write memory) once per process;
+    PSS splits them between the processes sharing them, so it adds up to the real footprint.
+    """
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; ppid is the second field after it
+                parents[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+    pids = {root_pid}
+    changed = True
+    while changed:
+        changed = False
+        for pid, ppid in parents.items():
+            if ppid in pids and pid not in pids:
+                pids.add(pid)
+                changed = True
+    totals = {"rss": 0.0, "pss": 0.0}
+    for pid in pids:
+        for key, mb in process_memory_mb(pid).items():
+            totals[key] += mb
+    return {key: round(mb, 1) for key, mb in totals.items()}
+
+
+def process_memory_mb(pid):
+    """RSS and PSS of one process (Linux /proc); zeros if it is gone"""
+    totals = {"rss": 0, "pss": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss"):
+                    totals[key.lower()] += int(value.split()[0])
+    except (OSError, ValueError):
+        pass
+    return {key: round(kb / 1024, 1) for key, kb in totals.items()}
@@ -0,0 +1,30 @@
+"""Stand-in for the transformers text-generation pipeline, for benchmarks that must run offline."""
+import time
+
+from stopping import close_statement
+
+
+class StubGenerator:
+    """Callable with the pipeline's signature: a str returns [{"generated_text"}], a list returns one such list per prompt.
+
+    Each call sleeps base_ms plus per_prompt_ms for every prompt in it, like a batched
+    forward pass, and completes the prompt into a closed JavaScript statement.
+    """
+
+    tokenizer = None
+
+    def __init__(self, base_ms=40.0, per_prompt_ms=5.0):
+        self.base = base_ms / 1000.0
+        self.per_prompt = per_prompt_ms / 1000.0
+        self.calls = 0
+
+    def _complete(self, prompt):
+        return [{"generated_text": close_statement(prompt)}]
+
+    def __call__(self, text_inputs, **kwargs):
+        self.calls += 1
+        prompts = [text_inputs] if isinstance(text_inputs, str) else list(text_inputs)
+        time.sleep(self.base + self.per_prompt * len(prompts))
+        if isinstance(text_inputs, str):
+            return self._complete(text_inputs)
+        return [self._complete(prompt) for prompt in prompts]
@@ -0,0 +1,235 @@
+"""Reproducible benchmark suite for the /generate, save and export paths.
+
+Runs offline by default: the model is replaced by a stub with the pipeline's call signature
+and a configurable latency. --real-model loads MODEL_NAME instead. The report (p50/p95/p99,
+throughput, RSS) is written as JSON; --baseline compares it with a saved report and exits
+non-zero when something regressed by more than --tolerance.
+
+Usage:
+  python benchmarks/suite.py --output report.json
+  python benchmarks/suite.py --baseline report.json --tolerance 0.15
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from common import current_rss_mb, peak_rss_mb, summarize
+
+PROMPTS = [
+    "make buttons blue", "hide images", "make text bold", "change background to yellow",
+    "make buttons purple", "show images", "make text bigger", "hide buttons",
+    "make images smaller", "make text italic", "change text color to red", "do something fun",
+]
+
+# Latency differences below this are timer noise, not regressions
+NOISE_FLOOR_MS = 0.1
+
+
+def bench_function(func, iterations):
+    """Per-call latency, timed over small groups of calls to keep timer overhead out"""
+    group = 50
+    samples = []
+    start = time.perf_counter()
+    for i in range(max(1, iterations // group)):
+        t = time.perf_counter()
+        for j in range(group):
+            func(PROMPTS[(i + j) % len(PROMPTS)])
+        samples.append((time.perf_counter() - t) / group)
+    elapsed = time.perf_counter() - start
+    return summarize(samples, elapsed / group)
+
+
+async def bench_generate(app, concurrency, total):
+    import httpx
+
+    limiter = asyncio.Semaphore(concurrency)
+    latencies = []
+    sources = {}
+
+    async def one(client, i):
+        async with limiter:
+            t = time.perf_counter()
+            response = await client.get("/generate", params={"prompt": PROMPTS[i % len(PROMPTS)]})
+            latencies.append(time.perf_counter() - t)
+            source = response.json().get("source", str(response.status_code))
+            sources[source] = sources.get(source, 0) + 1
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app.app), base_url="http://bench") as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client, i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+    return {**summarize(latencies, elapsed), "concurrency": concurrency, "sources": sources}
+
+
+def fill_store(store, start, end):
+    from script_store import ScriptStore
+
+    entry = {"prompt": "make buttons blue", "code": "document.body.style.color = 'blue';", "source": "ai",
+             "success": True, "timestamp": "2026-01-01T00:00:00Z", "url": "https://example.com", "platform": "Linux"}
+    store._conn.execute("BEGIN")
+    store._conn.executemany(
+        "INSERT INTO scripts (prompt, code, source, success, timestamp, url, platform) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (ScriptStore._row_values(entry) for _ in range(start, end)),
+    )
+    store._conn.execute("COMMIT")
+
+
+def bench_save_and_export(app, tmp, sizes, samples):
+    from script_store import ScriptStore
+
+    results = {}
+    store = ScriptStore(os.path.join(tmp, "bench_scripts.db"))
+    app.script_store = store
+    filled = 0
+    for size in sizes:
+        fill_store(store, filled, size)
+        filled = max(filled, size)
+        timings = []
+        start = time.perf_counter()
+        for i in range(samples):
+            t = time.perf_counter()
+            app.save_script({"prompt": f"make buttons blue {i}", "code": "document.body.style.color = 'blue';",
+                             "source": "ai", "success": True, "url": "https://example.com"})
+            timings.append(time.perf_counter() - t)
+        results[f"save_script@{size}"] = summarize(timings, time.perf_counter() - start)
+        filled += samples
+
+    ids = list(range(1, min(filled, 1000) + 1))
+    for label, warm in (("cold", False), ("warm", True)):
+        app.render_cache.purge()
+        if warm:
+            for script_id in ids:
+                app.export_tampermonkey(script_id)
+        timings = []
+        start = time.perf_counter()
+        for i in range(samples):
+            if not warm:
+                app.render_cache.purge()
+            t = time.perf_counter()
+            app.export_tampermonkey(ids[i % len(ids)])
+            timings.append(time.perf_counter() - t)
+        results[f"export_tampermonkey_{label}"] = summarize(timings, time.perf_counter() - start)
+    store.close()
+    return results
+
+
+def compare(report, baseline, tolerance):
+    """Names and details of every benchmark that got slower than the baseline allows"""
+    regressions = []
+    for name, result in report["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if key in result and key in base and result[key] > max(base[key] * (1 + tolerance), base[key] + NOISE_FLOOR_MS):
+                regressions.append(f"{name} {key}: {base[key]} -> {result[key]}")
+        # Throughput of sub-noise-floor calls swings with scheduling, so only judge it on slower paths
+        if "throughput_per_s" in result and "throughput_per_s" in base and base["p50_ms"] >= NOISE_FLOOR_MS:
+            if result["throughput_per_s"] < base["throughput_per_s"] * (1 - tolerance):
+                regressions.append(f"{name} throughput_per_s: {base['throughput_per_s']} -> {result['throughput_per_s']}")
+    return regressions
+
+
+def run(args, tmp):
+    # Keep the benchmark's store and verdicts out of the working tree; must happen before importing app
+    os.environ.setdefault("SCRIPTS_DB_PATH", os.path.join(tmp, "scripts.db"))
+    os.environ.setdefault("QUALITY_VERDICT_FILE", os.path.join(tmp, "model_quality.json"))
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    import app
+    import intents
+    from stub_generator import StubGenerator
+
+    rss_before_model = current_rss_mb()
+    if args.real_model:
+        app.load_model()
+        if app.generator is None:
+            raise SystemExit(f"Model did not become ready: {app.model_state['status']} {app.model_state['error'] or ''}")
+        model = app.generator
+    else:
+        model = StubGenerator(base_ms=args.stub_latency_ms, per_prompt_ms=args.stub_per_prompt_ms)
+
+    results = {}
+    results["extract_color"] = bench_function(intents.extract_color, args.iterations)
+    results["enhance_prompt_for_codet5"] = bench_function(intents.enhance_prompt_for_codet5, args.iterations)
+    results["generate_fallback_code"] = bench_function(intents.generate_fallback_code, args.iterations)
+
+    cache_size = app.response_cache.max_entries
+    for concurrency in args.concurrency:
+        app.generator = None
+        # Otherwise every fallback after the first round is a cache hit from the previous concurrency
+        app.response_cache.purge()
+        results[f"generate_fallback@c{concurrency}"] = asyncio.run(bench_generate(app, concurrency, args.requests))
+        app.generator = model
+        app.response_cache.purge()
+        app.response_cache.max_entries = 0
+        results[f"generate_model@c{concurrency}"] = asyncio.run(bench_generate(app, concurrency, args.requests))
+        app.response_cache.max_entries = cache_size
+        app.response_cache.purge()
+        results[f"generate_cached@c{concurrency}"] = asyncio.run(bench_generate(app, concurrency, args.requests))
+
+    results.update(bench_save_and_export(app, tmp, args.store_sizes, args.save_samples))
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": f"{platform.system()} {platform.machine()}",
+            "model": app.MODEL_NAME if args.real_model else "stub",
+            "stub_latency_ms": None if args.real_model else args.stub_latency_ms,
+            "stub_per_prompt_ms": None if args.real_model else args.stub_per_prompt_ms,
+            "requests": args.requests,
+        },
+        "rss_mb": {"before_model": rss_before_model, "end": current_rss_mb(), "peak": peak_rss_mb()},
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="saved report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown, as a fraction")
+    parser.add_argument("--real-model", action="store_true", help="load MODEL_NAME instead of the stub")
+    parser.add_argument("--stub-latency-ms", type=float, default=40.0)
+    parser.add_argument("--stub-per-prompt-ms", type=float, default=5.0)
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=200, help="requests per /generate scenario")
+    parser.add_argument("--iterations", type=int, default=20000, help="calls per function benchmark")
+    parser.add_argument("--store-sizes", default="0,10000,100000")
+    parser.add_argument("--save-samples", type=int, default=200)
+    args = parser.parse_args()
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+    args.store_sizes = sorted(int(s) for s in args.store_sizes.split(","))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Keep the app's log lines out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = run(args, tmp)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+        print(f"Report written to {args.output}")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"❌ Regression: {regression}")
+        print(f"{len(regressions)} regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
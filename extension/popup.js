@@ -14,14 +14,17 @@ document.addEventListener("DOMContentLoaded", () => {
     showStatus("Executing...", false);
 
     try {
-      // Call your app.py /generate endpoint
-      const response = await fetch(`http://localhost:8000/generate?prompt=${encodeURIComponent(prompt)}`);
-      
-      if (!response.ok) {
-        throw new Error(`HTTP ${response.status}: ${response.statusText}`);
-      }
-      
-      const data = await response.json();
+      // Stream from app.py /generate_stream; closing the popup closes the stream and stops the model
+      let generated = "";
+      const data = await generateStreaming(prompt, (event, payload) => {
+        if (event === "candidate") {
+          showStatus("Generating...", false);
+        } else if (event === "token") {
+          // Each token event carries only the newly decoded piece
+          generated += payload.text;
+          showStatus(`Generating... ${generated}`, false);
+        }
+      });
       console.log("Received response:", data);
 
       // Get current tab
@@ -75,7 +78,7 @@ function showStatus(message, isError = false) {
     status.textContent = message;
     status.className = isError ? 'error' : 'success';
     
-    if (message === "Executing...") {
+    if (message === "Executing..." || message.startsWith("Generating...")) {
         return;
     }
     
@@ -209,6 +212,46 @@ function genericExecution(promptText) {
   }, 2000);
 }
 
+// Read the Server-Sent Events from /generate_stream; resolves with the "final" response
+async function generateStreaming(prompt, onEvent) {
+  const response = await fetch(`http://localhost:8000/generate_stream?prompt=${encodeURIComponent(prompt)}`);
+  if (!response.ok) {
+    throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) {
+      break;
+    }
+    buffer += decoder.decode(value, { stream: true });
+    let end;
+    while ((end = buffer.indexOf("\n\n")) !== -1) {
+      const message = buffer.slice(0, end);
+      buffer = buffer.slice(end + 2);
+      let event = "message";
+      let data = "";
+      for (const line of message.split("\n")) {
+        if (line.startsWith("event: ")) {
+          event = line.slice(7);
+        } else if (line.startsWith("data: ")) {
+          data += line.slice(6);
+        }
+      }
+      const payload = JSON.parse(data);
+      if (event === "final") {
+        reader.cancel();
+        return payload;
+      }
+      onEvent(event, payload);
+    }
+  }
+  throw new Error("Stream ended without a result");
+}
+
 // Save script using your app.py /save_script endpoint
 async function saveScript(prompt, code, success, source, url) {
   try {
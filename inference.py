@@ -0,0 +1,173 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class InferenceOverloaded(Exception):
+    """Raised by MicroBatcher.submit when the wait queue is full"""
+
+
+class MicroBatcher:
+    """Collect prompts arriving within a short window and run them as one batched generate call.
+
+    `run_batch(prompts, params)` is a blocking callable that returns one result per prompt,
+    in order. It runs on a dedicated executor with `slots` threads, so model inference never
+    competes with the server's shared threadpool, and at most `slots` batches run at once.
+    At most `max_queue` prompts may wait for a slot; further submits raise InferenceOverloaded.
+    Requests with different generation params are never mixed in one call. `run_alone` runs
+    any other blocking call (a streamed generation) through the same queue and slots.
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, window_ms=10.0, slots=1, max_queue=32):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.window = max(0.0, float(window_ms)) / 1000.0
+        self.slots = max(1, int(slots))
+        self.max_queue = max(0, int(max_queue))
+        self.executor = ThreadPoolExecutor(max_workers=self.slots, thread_name_prefix="inference")
+        self._queue = None
+        self._worker = None
+        self._free_slots = None
+        self._running = 0
+        self._rejected = 0
+        self._batches = 0
+        self._requests = 0
+        self._batch_sizes = {}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _ensure_worker(self):
+        # Created lazily so the queue and task belong to the running event loop
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._free_slots = asyncio.Semaphore(self.slots)
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    def queue_depth(self):
+        """Prompts waiting for an inference slot"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, prompt, params):
+        """Queue one prompt and wait for its result from the next batch"""
+        self._ensure_worker()
+        if self.queue_depth() >= self.max_queue:
+            self._rejected += 1
+            raise InferenceOverloaded(f"inference queue is full ({self.max_queue} waiting)")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((prompt, params, future, time.perf_counter()))
+        return await future
+
+    async def submit_many(self, prompts, params):
+        """Queue several prompts at once so they share batches; results come back in order"""
+        self._ensure_worker()
+        if self.queue_depth() + len(prompts) > self.max_queue:
+            self._rejected += len(prompts)
+            raise InferenceOverloaded(f"inference queue cannot take {len(prompts)} more prompts ({self.max_queue} max)")
+        loop = asyncio.get_running_loop()
+        futures = []
+        queued_at = time.perf_counter()
+        for prompt in prompts:
+            future = loop.create_future()
+            self._queue.put_nowait((prompt, params, future, queued_at))
+            futures.append(future)
+        return await asyncio.gather(*futures)
+
+    async def run_alone(self, fn, *args):
+        """Queue a blocking call like a prompt and run it by itself in an inference slot; returns its result"""
+        self._ensure_worker()
+        if self.queue_depth() >= self.max_queue:
+            self._rejected += 1
+            raise InferenceOverloaded(f"inference queue is full ({self.max_queue} waiting)")
+        future = asyncio.get_running_loop().create_future()
+        # No params: never grouped with prompts or other calls
+        self._queue.put_nowait((functools.partial(fn, *args), None, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        items = [await self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                # Still take whatever is already waiting, without blocking
+                while len(items) < self.max_batch_size and not self._queue.empty():
+                    items.append(self._queue.get_nowait())
+                break
+            try:
+                items.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return items
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Wait for a free slot first so the next batch keeps growing meanwhile
+            await self._free_slots.acquire()
+            try:
+                items = await self._collect()
+            except BaseException:
+                self._free_slots.release()
+                raise
+            loop.create_task(self._dispatch_all(items))
+
+    async def _dispatch_all(self, items):
+        self._running += 1
+        try:
+            groups = {}
+            for item in items:
+                key = tuple(sorted(item[1].items())) if item[1] is not None else id(item)
+                groups.setdefault(key, []).append(item)
+            for group in groups.values():
+                await self._dispatch(group)
+        finally:
+            self._running -= 1
+            self._free_slots.release()
+
+    async def _dispatch(self, group):
+        started = time.perf_counter()
+        group = [item for item in group if not item[2].cancelled()]
+        if not group:
+            return
+        for _, _, _, queued_at in group:
+            wait = started - queued_at
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+        self._batches += 1
+        self._requests += len(group)
+        self._batch_sizes[len(group)] = self._batch_sizes.get(len(group), 0) + 1
+
+        loop = asyncio.get_running_loop()
+        try:
+            if group[0][1] is None:
+                results = [await loop.run_in_executor(self.executor, group[0][0])]
+            else:
+                prompts = [item[0] for item in group]
+                results = await loop.run_in_executor(self.executor, self.run_batch, prompts, group[0][1])
+        except Exception as e:
+            for _, _, future, _ in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future, _), result in zip(group, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        """Batch size and queue wait metrics"""
+        return {
+            "batches": self._batches,
+            "requests": self._requests,
+            "avg_batch_size": round(self._requests / self._batches, 2) if self._batches else 0.0,
+            "batch_size_counts": dict(sorted(self._batch_sizes.items())),
+            "avg_queue_wait_ms": round(self._wait_total / self._requests * 1000, 3) if self._requests else 0.0,
+            "max_queue_wait_ms": round(self._wait_max * 1000, 3),
+            "queued": self.queue_depth(),
+            "max_queue": self.max_queue,
+            "rejected": self._rejected,
+            "running_batches": self._running,
+            "slots": self.slots,
+            "max_batch_size": self.max_batch_size,
+            "window_ms": self.window * 1000,
+        }
@@ -0,0 +1,284 @@
+"""Shared inference process for multi-worker serving.
+
+One process holds the model and serves any number of HTTP worker processes over a Unix
+socket (multiprocessing.connection), so N workers cost one model's memory instead of N.
+Prompts from all workers are merged into batches, taking one prompt per worker in turn so
+a busy worker cannot starve the others.
+
+Run standalone with `python -m inference_server --address /tmp/inference.sock`; `python app.py
+--workers N` starts it automatically.
+"""
+import argparse
+import importlib
+import itertools
+import logging
+import os
+import secrets
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteInferenceError(Exception):
+    """The inference server failed to run a batch"""
+
+
+class _Request:
+    def __init__(self, conn, send_lock, request_id, size, params):
+        self.conn = conn
+        self.send_lock = send_lock
+        self.request_id = request_id
+        self.params = params
+        self.results = [None] * size
+        self.remaining = size
+        self.failed = False
+
+    def reply(self, message):
+        try:
+            with self.send_lock:
+                self.conn.send(message)
+        except (OSError, EOFError, ValueError):
+            pass  # The worker went away; nothing to deliver
+
+
+class InferenceServer:
+    """Accept worker connections and run their prompts through run_batch(prompts, params).
+
+    Each worker has its own queue; a batch takes the oldest prompt of each worker in turn
+    (only prompts with the same params are mixed), and the worker served first moves to
+    the back for the next batch.
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, status=None, load_model=None):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.status = status or (lambda: {})
+        self.load_model = load_model or (lambda model_id: False)
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._client_ids = itertools.count(1)
+        self.batches = 0
+        self.prompts = 0
+        self.errors = 0
+
+    def stats(self):
+        with self._cond:
+            queued = sum(len(queue) for queue in self._pending.values())
+            clients = len(self._pending)
+        return {"clients": clients, "queued": queued, "batches": self.batches, "prompts": self.prompts,
+                "errors": self.errors, "max_batch_size": self.max_batch_size}
+
+    def serve_forever(self, listener):
+        threading.Thread(target=self._schedule, name="inference-scheduler", daemon=True).start()
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                # A worker that fails the handshake must not stop the server
+                logger.warning("Rejected inference client: %s", e)
+                continue
+            threading.Thread(target=self._serve_client, args=(conn,), daemon=True).start()
+
+    def _serve_client(self, conn):
+        client = next(self._client_ids)
+        send_lock = threading.Lock()
+        with self._cond:
+            self._pending[client] = deque()
+        logger.info("Inference client %d connected", client)
+        try:
+            while True:
+                message = conn.recv()
+                kind, request_id = message[0], message[1]
+                if kind == "status":
+                    with send_lock:
+                        conn.send(("ok", request_id, {**self.status(), "server": self.stats()}))
+                elif kind == "load":
+                    with send_lock:
+                        conn.send(("ok", request_id, self.load_model(message[2])))
+                elif kind == "generate":
+                    prompts, params = message[2], message[3]
+                    request = _Request(conn, send_lock, request_id, len(prompts), params)
+                    if not prompts:
+                        request.reply(("ok", request_id, []))
+                        continue
+                    with self._cond:
+                        self._pending[client].extend((request, i, prompt) for i, prompt in enumerate(prompts))
+                        self._cond.notify()
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self._cond:
+                self._pending.pop(client, None)
+            conn.close()
+            logger.info("Inference client %d disconnected", client)
+
+    def _next_batch(self):
+        with self._cond:
+            while not any(self._pending.values()):
+                self._cond.wait()
+            batch = []
+            params = None
+            first = None
+            progress = True
+            while progress and len(batch) < self.max_batch_size:
+                progress = False
+                for client, queue in self._pending.items():
+                    if not queue or (params is not None and queue[0][0].params != params):
+                        continue
+                    if params is None:
+                        params, first = queue[0][0].params, client
+                    batch.append(queue.popleft())
+                    progress = True
+                    if len(batch) == self.max_batch_size:
+                        break
+            self._pending.move_to_end(first)
+            return batch, params
+
+    def _schedule(self):
+        while True:
+            batch, params = self._next_batch()
+            self.batches += 1
+            self.prompts += len(batch)
+            try:
+                results = self.run_batch([item[2] for item in batch], params)
+            except Exception as e:
+                self.errors += 1
+                logger.exception("Inference batch failed: %s", e)
+                for request, _, _ in batch:
+                    if not request.failed:
+                        request.failed = True
+                        request.reply(("error", request.request_id, str(e)))
+                continue
+            for (request, index, _), result in zip(batch, results):
+                if request.failed:
+                    continue
+                request.results[index] = result
+                request.remaining -= 1
+                if request.remaining == 0:
+                    request.reply(("ok", request.request_id, request.results))
+
+
+class RemoteGenerator:
+    """Client for an InferenceServer with the text-generation pipeline's call signature.
+
+    Safe to call from several threads; replies are matched to calls by request id.
+    """
+
+    tokenizer = None
+
+    def __init__(self, address, authkey=None):
+        self.address = address
+        self._conn = Client(address, family="AF_UNIX", authkey=authkey)
+        self._send_lock = threading.Lock()
+        self._futures = {}
+        self._ids = itertools.count(1)
+        self._closed = False
+        threading.Thread(target=self._read_replies, name="inference-client", daemon=True).start()
+
+    def _call(self, kind, *payload):
+        future = Future()
+        with self._send_lock:
+            if self._closed:
+                raise ConnectionError(f"inference server at {self.address} is gone")
+            request_id = next(self._ids)
+            self._futures[request_id] = future
+            self._conn.send((kind, request_id) + payload)
+        return future.result()
+
+    def _read_replies(self):
+        try:
+            while True:
+                kind, request_id, payload = self._conn.recv()
+                future = self._futures.pop(request_id, None)
+                if future is None:
+                    continue
+                if kind == "error":
+                    future.set_exception(RemoteInferenceError(payload))
+                else:
+                    future.set_result(payload)
+        except (EOFError, OSError):
+            pass
+        with self._send_lock:
+            self._closed = True
+            futures, self._futures = self._futures, {}
+        for future in futures.values():
+            future.set_exception(ConnectionError(f"inference server at {self.address} is gone"))
+
+    def status(self):
+        """The server's model state and scheduler stats"""
+        return self._call("status")
+
+    def load_model(self, model_id):
+        """Ask the server to load and swap in a registry model; False if a load is already running"""
+        return self._call("load", model_id)
+
+    def __call__(self, text_inputs, **kwargs):
+        # Batching happens on the server, across workers
+        kwargs.pop("batch_size", None)
+        prompts = [text_inputs] if isinstance(text_inputs, str) else list(text_inputs)
+        results = self._call("generate", prompts, kwargs)
+        return results[0] if isinstance(text_inputs, str) else results
+
+    def close(self):
+        self._conn.close()
+
+
+def start_inference_server(address=None, authkey=None, extra_args=(), env=None):
+    """Launch `python -m inference_server` as a child process; returns (process, address, authkey)"""
+    address = address or os.path.join(tempfile.mkdtemp(prefix="inference-"), "inference.sock")
+    authkey = authkey or secrets.token_hex(16)
+    env = {**(os.environ if env is None else env), "INFERENCE_SERVER_AUTHKEY": authkey}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "inference_server", "--address", address, *extra_args],
+        env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    return process, address, authkey
+
+
+def _load_factory(spec):
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared inference process for multi-worker serving")
+    parser.add_argument("--address", required=True, help="Unix socket path to listen on")
+    parser.add_argument("--max-batch-size", type=int, default=int(os.environ.get("BATCH_MAX_SIZE", "8")))
+    parser.add_argument("--generator", default=os.environ.get("INFERENCE_GENERATOR"),
+                        help="module:callable returning a generator to use instead of MODEL_NAME (testing/benchmarks)")
+    args = parser.parse_args()
+
+    import app
+
+    authkey = os.environ.get("INFERENCE_SERVER_AUTHKEY", "").encode() or None
+    if args.generator:
+        app.generator = _load_factory(args.generator)()
+        app.model_state.update(status="ready", model=args.generator, ready_at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+    else:
+        # Answer status requests while the model loads
+        threading.Thread(target=app.load_model, name="model-loader", daemon=True).start()
+        if app.MODEL_IDLE_TIMEOUT > 0:
+            threading.Thread(target=app.unload_idle_model, name="model-idle", daemon=True).start()
+
+    if os.path.exists(args.address):
+        os.unlink(args.address)
+    listener = Listener(args.address, family="AF_UNIX", authkey=authkey)
+    os.chmod(args.address, 0o600)
+    server = InferenceServer(app.run_generator_batch, args.max_batch_size, status=lambda: {**app.model_state, **app.model_process_stats()},
+                             load_model=app.start_model_load)
+    logger.info("Inference server listening on %s", args.address)
+    try:
+        server.serve_forever(listener)
+    finally:
+        listener.close()
+
+
+if __name__ == "__main__":
+    main()
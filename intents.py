@@ -0,0 +1,213 @@
+"""Pattern-based command intents for the fallback path and for model prompts.
+
+Commands are rows in an intent table (target element, style property, value, keywords).
+All keywords and colors are compiled once into a single regex, so a prompt is scanned
+once no matter how many rows there are. To support a new command, add a row.
+"""
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+COLORS = ['red', 'blue', 'green', 'yellow', 'purple', 'orange', 'pink', 'black', 'white', 'gray', 'grey', 'brown', 'cyan', 'magenta', 'lime', 'navy', 'maroon', 'olive', 'teal', 'silver', 'gold', 'lightpink', 'lightblue', 'lightgreen']
+DEFAULT_COLOR = 'blue'
+
+# Colors that make a button/background prompt worth sending to the model
+MODEL_COLORS = ('red', 'blue', 'green', 'yellow', 'purple', 'orange', 'pink')
+
+
+class Intent(NamedTuple):
+    target: str      # "button", "img" or "body"
+    action: str      # style property to set
+    value: str       # "{color}" is replaced with the color found in the prompt
+    requires: tuple  # keyword groups; each group needs at least one of its keywords in the prompt
+
+
+# First matching row wins, so more specific rows go first
+FALLBACK_INTENTS = (
+    Intent("button", "backgroundColor", "{color}", (("button",),)),
+    Intent("body", "backgroundColor", "{color}", (("background",),)),
+    Intent("body", "color", "{color}", (("text",), ("color",))),
+    Intent("button", "display", "none", (("hide",), ("button",))),
+    Intent("button", "display", "block", (("show",), ("button",))),
+    Intent("img", "display", "none", (("hide",), ("image", "img"))),
+    Intent("img", "display", "block", (("show",), ("image", "img"))),
+    Intent("img", "width", "50px", (("small", "smaller"), ("image",))),
+    Intent("img", "width", "200px", (("big", "larger"), ("image",))),
+    Intent("body", "fontSize", "20px", (("text",), ("big", "larger"))),
+    Intent("body", "fontSize", "12px", (("text",), ("small", "smaller"))),
+    Intent("body", "fontWeight", "bold", (("bold",),)),
+    Intent("body", "fontStyle", "italic", (("italic",),)),
+)
+
+# CodeT5+ works better with simpler, more direct prompts
+MODEL_INTENTS = (
+    Intent("button", "backgroundColor", "{color}", (("button",), MODEL_COLORS)),
+    Intent("body", "backgroundColor", "{color}", (("background",), MODEL_COLORS)),
+    Intent("img", "display", "none", (("hide",), ("image",))),
+    Intent("button", "display", "none", (("hide",), ("button",))),
+)
+GENERIC_MODEL_PROMPT = "document.querySelectorAll"
+
+_TARGET_CODE = {
+    "button": ("document.querySelectorAll('button').forEach(btn => btn.style.{action} = '{value}'", ");"),
+    "img": ("document.querySelectorAll('img').forEach(img => img.style.{action} = '{value}'", ");"),
+    "body": ("document.body.style.{action} = '{value}'", ";"),
+}
+
+
+def _trie_pattern(words):
+    """Regex alternation factored by common prefixes; matches the longest word at a position"""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = "(?:" + "|".join(branches) + ")"
+        return body + "?" if "" in node else body
+
+    return build(trie)
+
+
+def _compile():
+    keywords = set(COLORS)
+    for intent in FALLBACK_INTENTS + MODEL_INTENTS:
+        for group in intent.requires:
+            keywords.update(group)
+    bits = {keyword: 1 << i for i, keyword in enumerate(sorted(keywords))}
+    # The lookahead lets matches overlap; at each position the longest keyword is reported and
+    # shorter keywords inside it ("pink" in "lightpink") are implied through its mask.
+    pattern = re.compile("(?=(" + _trie_pattern(keywords) + "))")
+    implied = {}
+    for keyword in keywords:
+        mask = 0
+        for other in keywords:
+            if other in keyword:
+                mask |= bits[other]
+        implied[keyword] = mask
+    # extract_color prefers longer names (lightpink over pink); ties keep list order
+    colors = tuple((bits[c], c) for c in sorted(COLORS, key=len, reverse=True))
+
+    def compile_table(table, complete):
+        rows = []
+        for intent in table:
+            groups = tuple(sum(bits[k] for k in group) for group in intent.requires)
+            # Pre-render every color variant so matching ends in a dict lookup
+            if "{color}" in intent.value:
+                code = {color: render(intent, color, complete) for color in COLORS + [DEFAULT_COLOR]}
+            else:
+                code = render(intent, None, complete)
+            rows.append((intent, groups, code))
+        return tuple(rows)
+
+    return pattern, implied, colors, compile_table(FALLBACK_INTENTS, True), compile_table(MODEL_INTENTS, False)
+
+
+@lru_cache(maxsize=4096)
+def _scan(text_lower):
+    """Bit mask of every keyword occurring anywhere in the text (memoized: users repeat commands)"""
+    mask = 0
+    for keyword in _KEYWORD_PATTERN.findall(text_lower):
+        mask |= _IMPLIED_MASK[keyword]
+    return mask
+
+
+def _color(mask):
+    for bit, color in _COLOR_BITS:
+        if mask & bit:
+            return color
+    return DEFAULT_COLOR
+
+
+def _match(table, mask):
+    for row in table:
+        for group in row[1]:
+            if not mask & group:
+                break
+        else:
+            return row
+    return None
+
+
+def _code(row, mask):
+    code = row[2]
+    return code[_color(mask)] if isinstance(code, dict) else code
+
+
+def render(intent, color, complete=True):
+    """JavaScript for an intent; complete=False leaves the statement open for the model"""
+    template, terminator = _TARGET_CODE[intent.target]
+    code = template.format(action=intent.action, value=intent.value.format(color=color))
+    return code + terminator if complete else code
+
+
+_KEYWORD_PATTERN, _IMPLIED_MASK, _COLOR_BITS, _FALLBACK_TABLE, _MODEL_TABLE = _compile()
+
+
+def parse_command(prompt):
+    """Return (fallback intent or None, color) for a prompt in a single scan"""
+    mask = _scan(prompt.lower())
+    row = _match(_FALLBACK_TABLE, mask)
+    return (row[0] if row else None), _color(mask)
+
+
+def extract_color(text):
+    """Extract color from user input"""
+    return _color(_scan(text.lower()))
+
+
+def enhance_prompt_for_codet5(user_prompt):
+    """Better prompts for CodeT5+ model"""
+    mask = _scan(user_prompt.lower())
+    row = _match(_MODEL_TABLE, mask)
+    return _code(row, mask) if row else GENERIC_MODEL_PROMPT
+
+
+def model_prompts():
+    """Every prompt enhance_prompt_for_codet5 can return (a few dozen: templates x colors)"""
+    prompts = [GENERIC_MODEL_PROMPT]
+    for _, _, code in _MODEL_TABLE:
+        prompts.extend(code.values() if isinstance(code, dict) else [code])
+    return list(dict.fromkeys(prompts))
+
+
+_CONJUNCTIONS = re.compile(r"(\s*(?:[,;&]|\band then\b|\bthen\b|\band\b|\balso\b)\s*)", re.IGNORECASE)
+
+
+def split_compound(prompt):
+    """Split "make buttons blue and hide images" into single commands.
+
+    A part that matches no intent on its own ("white" in "make text black and white") is
+    joined back onto the command before it, so only real commands are split apart.
+    """
+    pieces = _CONJUNCTIONS.split(prompt)
+    commands = []
+    separator = ""
+    for i, piece in enumerate(pieces):
+        if i % 2:
+            separator = piece
+            continue
+        if not piece.strip():
+            continue
+        if commands and _match(_FALLBACK_TABLE, _scan(piece.lower())) is None:
+            commands[-1] += separator + piece
+        else:
+            commands.append(piece)
+    return [command.strip() for command in commands] or [prompt.strip()]
+
+
+def generic_fallback_code(prompt):
+    """Visual confirmation for commands no intent matches"""
+    return f"console.log('Extension executed: {prompt}'); document.body.style.border = '2px solid green'; setTimeout(() => document.body.style.border = '', 2000);"
+
+
+def generate_fallback_code(prompt):
+    """Generate reliable fallback code with enhanced patterns"""
+    mask = _scan(prompt.lower())
+    row = _match(_FALLBACK_TABLE, mask)
+    return _code(row, mask) if row else generic_fallback_code(prompt)
@@ -0,0 +1,137 @@
+"""Structured logging that never blocks the request path.
+
+Records go onto an in-memory queue and a background thread formats and writes them, so a
+slow stdout (e.g. a log collector) adds no latency to requests. Every record carries the id
+of the request it was logged from. Verbose lines (prompts and model output) are logged with
+extra=VERBOSE and kept only for a sampled share of requests.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+request_id_var = ContextVar("request_id", default="-")
+_verbose_sampled = ContextVar("verbose_sampled", default=True)
+
+# Pass as extra= on prompt/output lines so they follow LOG_SAMPLE_RATE
+VERBOSE = {"verbose": True}
+
+_listener = None
+_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Tags records with the request id and hands them to the listener thread.
+
+    Only the message is rendered here; formatting and I/O happen on the listener thread.
+    When the queue is full the record is dropped and counted instead of blocking.
+    """
+
+    def __init__(self, log_queue, sample_rate):
+        super().__init__(log_queue)
+        self.sample_rate = sample_rate
+        self.dropped = 0
+
+    def filter(self, record):
+        if getattr(record, "verbose", False) and not _verbose_sampled.get():
+            return False
+        record.request_id = request_id_var.get()
+        return super().filter(record)
+
+    def prepare(self, record):
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level="INFO", fmt="text", sample_rate=1.0, max_queue=10000):
+    """Route the root logger through the queue; safe to call more than once"""
+    global _listener, _handler
+    if _listener is not None:
+        return _handler
+    log_queue = queue.Queue(maxsize=max(0, int(max_queue)))
+    output = logging.StreamHandler(sys.stdout)
+    if fmt == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"))
+    _handler = NonBlockingQueueHandler(log_queue, min(max(float(sample_rate), 0.0), 1.0))
+    root = logging.getLogger()
+    root.handlers = [_handler]
+    root.setLevel(level.upper())
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _handler
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped_records():
+    return _handler.dropped if _handler is not None else 0
+
+
+class RequestIdMiddleware:
+    """ASGI middleware: a request id per request (the X-Request-ID header, or a new one),
+    echoed back in the response, plus the sampling decision for its verbose log lines"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex[:12]
+        rate = _handler.sample_rate if _handler is not None else 1.0
+        id_token = request_id_var.set(request_id)
+        sampled_token = _verbose_sampled.set(rate >= 1.0 or random.random() < rate)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(id_token)
+            _verbose_sampled.reset(sampled_token)
@@ -0,0 +1,159 @@
+"""Minimal Prometheus text-format metrics: counters, histograms and scrape-time gauges.
+
+Recording is a dict update under a lock, cheap enough to leave on in production;
+all formatting happens when /metrics is scraped.
+"""
+import bisect
+import logging
+import math
+import threading
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans sub-millisecond pattern lookups up to slow CPU generations
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+class Counter:
+    """Monotonic count per label combination; label values are passed positionally"""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labelvalues, value in values:
+            yield self.name, _labels(self.labelnames, labelvalues), value
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label combination (Prometheus `le` semantics)"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # Per-bucket counts (last one is +Inf), sum, count
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labelvalues):
+        series = self._series.get(labelvalues)
+        return series[2] if series else 0
+
+    def samples(self):
+        with self._lock:
+            snapshot = sorted((labelvalues, (list(s[0]), s[1], s[2])) for labelvalues, s in self._series.items())
+        for labelvalues, (counts, total, count) in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield self.name + "_bucket", _labels(self.labelnames, labelvalues, (("le", _number(bound)),)), cumulative
+            yield self.name + "_sum", _labels(self.labelnames, labelvalues), total
+            yield self.name + "_count", _labels(self.labelnames, labelvalues), count
+
+
+class Callback:
+    """Value read at scrape time from func(), which returns a number, None (no sample),
+    or a dict of {label values tuple: number}"""
+
+    def __init__(self, name, help_text, func, kind="gauge", labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.func = func
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        value = self.func()
+        if value is None:
+            return
+        if not isinstance(value, dict):
+            value = {(): value}
+        for labelvalues, number in sorted(value.items()):
+            if number is not None:
+                yield self.name, _labels(self.labelnames, labelvalues), number
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge_callback(self, name, help_text, func, labelnames=()):
+        return self._register(Callback(name, help_text, func, "gauge", labelnames))
+
+    def counter_callback(self, name, help_text, func, labelnames=()):
+        return self._register(Callback(name, help_text, func, "counter", labelnames))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                # One broken source (e.g. a closed store) must not take the whole scrape down
+                logger.warning("Metric %s failed: %s", metric.name, e)
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {_number(value)}" for name, labels, value in samples)
+        return "\n".join(lines) + "\n"
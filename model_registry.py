@@ -0,0 +1,46 @@
+"""Models the server can run, listed in models.json:
+
+    {
+      "default": "codet5p-770m",
+      "models": {
+        "codet5p-770m": {"name": "Salesforce/codet5p-770m"},
+        "codegpt-small-py": {"name": "microsoft/CodeGPT-small-py", "revision": "main"}
+      }
+    }
+
+Ids are what the admin API takes; name (and the optional revision) is what gets loaded.
+"""
+import json
+from typing import NamedTuple, Optional
+
+
+class ModelSpec(NamedTuple):
+    id: str
+    name: str                       # Hugging Face model name or local path
+    revision: Optional[str] = None  # branch, tag or commit; None for the default branch
+    description: str = ""
+
+
+def load_registry(path, override_name=None):
+    """Read the registry file; returns ({id: ModelSpec}, default id).
+
+    override_name (MODEL_NAME) replaces the default: a registered id or name, or any other
+    model, which is then added under its own name. A missing file is an empty registry.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        config = {}
+    models = {}
+    for model_id, entry in config.get("models", {}).items():
+        if isinstance(entry, str):
+            entry = {"name": entry}
+        models[model_id] = ModelSpec(model_id, entry["name"], entry.get("revision"), entry.get("description", ""))
+    default = config.get("default") or next(iter(models), None)
+    if override_name:
+        default = next((spec.id for spec in models.values() if override_name in (spec.id, spec.name)), override_name)
+        models.setdefault(default, ModelSpec(default, override_name))
+    if default not in models:
+        raise ValueError(f"Default model {default!r} is not listed in {path}")
+    return models, default
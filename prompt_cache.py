@@ -0,0 +1,136 @@
+"""Precomputed model state for the fixed set of enhanced prompts.
+
+enhance_prompt_for_codet5 only ever returns a few dozen prompts (intents.model_prompts()),
+so their token ids and their encoder outputs (encoder-decoder models) or prefix key/value
+cache (decoder-only models) are computed once at warmup. Generating for a cached prompt
+then goes straight to decoding, without tokenizing or encoding the prompt again and
+without the pipeline's pre- and post-processing.
+"""
+import logging
+import time
+
+import torch
+import torch.nn.functional as F
+
+logger = logging.getLogger(__name__)
+
+# Pipeline call options that are not generate() arguments
+_PIPELINE_ONLY_PARAMS = ("truncation", "batch_size", "return_full_text")
+
+
+def _layer_tensors(cache):
+    """(keys, values) per layer of a transformers KV cache, across cache API versions"""
+    if hasattr(cache, "layers"):
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    if hasattr(cache, "key_cache"):
+        return list(zip(cache.key_cache, cache.value_cache))
+    return [(keys, values) for keys, values, *_ in cache]
+
+
+class PromptCache:
+    """Prompt -> (token ids, encoder output or per-layer prefix keys/values) for one pipeline.
+
+    generate() returns results in the pipeline's format, or None when any prompt of the
+    batch is not cached so the caller can use the pipeline instead.
+    """
+
+    def __init__(self, pipeline):
+        self.model = pipeline.model
+        self.tokenizer = pipeline.tokenizer
+        self.is_encoder_decoder = bool(self.model.config.is_encoder_decoder)
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.warm_seconds = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, prompt):
+        return prompt in self._entries
+
+    def warm(self, prompts):
+        """Precompute every prompt; returns how many are cached"""
+        start = time.perf_counter()
+        with torch.inference_mode():
+            for prompt in prompts:
+                entry = self._encode(prompt)
+                if entry is not None:
+                    self._entries[prompt] = entry
+        self.warm_seconds = round(time.perf_counter() - start, 3)
+        logger.info("Prompt cache: %d prompts precomputed in %ss", len(self._entries), self.warm_seconds)
+        return len(self._entries)
+
+    def _encode(self, prompt):
+        input_ids = self.tokenizer(prompt, return_tensors="pt").input_ids.to(self.model.device)
+        if self.is_encoder_decoder:
+            hidden = self.model.get_encoder()(input_ids=input_ids).last_hidden_state
+            return input_ids[0], hidden[0]
+        if input_ids.shape[1] < 2:
+            return None
+        # All but the last token: generate() has to run that one itself to get the first logits
+        cache = self.model(input_ids[:, :-1], use_cache=True).past_key_values
+        return input_ids[0], [(keys[0], values[0]) for keys, values in _layer_tensors(cache)]
+
+    def generate(self, prompts, params, stopping_criteria=None, streamer=None):
+        entries = [self._entries.get(prompt) for prompt in prompts]
+        if any(entry is None for entry in entries):
+            self.misses += len(prompts)
+            return None
+        self.hits += len(prompts)
+        kwargs = {name: value for name, value in params.items() if name not in _PIPELINE_ONLY_PARAMS}
+        with torch.inference_mode():
+            if self.is_encoder_decoder:
+                sequences, new_tokens = self._generate_encoder_decoder(entries, kwargs, stopping_criteria, streamer)
+            else:
+                sequences, new_tokens = self._generate_decoder_only(entries, kwargs, stopping_criteria, streamer)
+        per_prompt = kwargs.get("num_return_sequences", 1)
+        texts = self.tokenizer.batch_decode(sequences[:, new_tokens:], skip_special_tokens=True)
+        return [
+            [{"generated_text": prompt + text} for text in texts[i * per_prompt:(i + 1) * per_prompt]]
+            for i, prompt in enumerate(prompts)
+        ]
+
+    def _generate_encoder_decoder(self, entries, kwargs, stopping_criteria, streamer):
+        from transformers.modeling_outputs import BaseModelOutput
+
+        longest = max(len(ids) for ids, _ in entries)
+        attention_mask = torch.zeros((len(entries), longest), dtype=torch.long, device=self.model.device)
+        hidden = []
+        for row, (ids, states) in enumerate(entries):
+            attention_mask[row, :len(ids)] = 1
+            hidden.append(F.pad(states, (0, 0, 0, longest - len(ids))))
+        sequences = self.model.generate(
+            encoder_outputs=BaseModelOutput(last_hidden_state=torch.stack(hidden)),
+            attention_mask=attention_mask, stopping_criteria=stopping_criteria, streamer=streamer, **kwargs,
+        )
+        # Decoder output only; the first token is the decoder start token
+        return sequences, 1
+
+    def _generate_decoder_only(self, entries, kwargs, stopping_criteria, streamer):
+        from transformers import DynamicCache
+
+        # Left-padded like the pipeline batches decoder-only prompts; padded cache slots are masked out
+        longest = max(len(ids) for ids, _ in entries)
+        pad_id = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else 0
+        input_ids = torch.full((len(entries), longest), pad_id, dtype=torch.long, device=self.model.device)
+        attention_mask = torch.zeros_like(input_ids)
+        for row, (ids, _) in enumerate(entries):
+            input_ids[row, longest - len(ids):] = ids
+            attention_mask[row, longest - len(ids):] = 1
+        past = DynamicCache()
+        for layer in range(len(entries[0][1])):
+            keys, values = [], []
+            for ids, layers in entries:
+                pad = (0, 0, longest - len(ids), 0)
+                keys.append(F.pad(layers[layer][0], pad))
+                values.append(F.pad(layers[layer][1], pad))
+            past.update(torch.stack(keys), torch.stack(values), layer)
+        sequences = self.model.generate(
+            input_ids=input_ids, attention_mask=attention_mask, past_key_values=past,
+            stopping_criteria=stopping_criteria, streamer=streamer, **kwargs,
+        )
+        return sequences, longest
+
+    def stats(self):
+        return {"prompts": len(self._entries), "hits": self.hits, "misses": self.misses, "warm_seconds": self.warm_seconds}
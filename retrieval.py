@@ -0,0 +1,245 @@
+"""Similarity index over prompts of scripts that worked, so rephrased known commands skip the model.
+
+Prompts become hashed character n-gram TF-IDF vectors (L2-normalized). Rows are kept sparse,
+one group per signature (see RetrievalIndex), so a lookup only scores the rows it could match
+and memory grows with the n-grams actually stored (8 bytes each, about 0.5KB per prompt)
+rather than with `dim`. Each prompt is indexed once (the latest code wins). IDF weights are
+recomputed whenever the index has doubled in size, so adding an entry stays cheap.
+"""
+import re
+import threading
+import zlib
+
+import numpy as np
+
+# Rows a group scores one by one before folding them into its column arrays
+_PENDING_ROWS = 256
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+# Filler that says nothing about the command; dropped before vectorizing
+_STOPWORDS = frozenset({"a", "an", "the", "all", "every", "each", "any", "some", "please", "this", "that",
+                        "page", "on", "of", "to", "my", "in", "for", "can", "you", "just"})
+
+# Words that flip a command's meaning while barely changing its text ("hide X" vs "show X");
+# a match must contain exactly the same ones
+_ACTION_WORDS = frozenset({"hide", "show", "remove", "delete", "add", "enable", "disable", "off", "not",
+                           "dont", "no", "increase", "decrease", "bigger", "smaller", "larger", "big", "small",
+                           "more", "less", "top", "bottom", "left", "right", "first", "last"})
+
+
+def normalize(prompt):
+    return " ".join(_PUNCTUATION.sub(" ", prompt.lower()).split())
+
+
+def _content(key):
+    return " ".join(word for word in key.split() if word not in _STOPWORDS) or key
+
+
+def _actions(key):
+    return frozenset(word for word in key.split() if word in _ACTION_WORDS)
+
+
+class _Group:
+    """Rows sharing one signature, stored sparse and column-major (per hashed column, the rows
+    that contain it and their term frequencies) so a lookup only reads the query's columns.
+
+    Rows added since the last compact() wait in `pending` and are scored row by row.
+    """
+
+    def __init__(self, dim):
+        self.rows = []          # position -> global row id
+        self.norms = np.zeros(0, dtype=np.float32)
+        self.colptr = np.zeros(dim + 1, dtype=np.int64)
+        self.positions = np.zeros(0, dtype=np.int32)
+        self.tf = np.zeros(0, dtype=np.float32)
+        self.pending = []       # (columns, tf) of rows not yet in the column arrays
+        self.compacted = 0
+
+    def append(self, row, columns, tf, idf):
+        count = len(self.rows)
+        if count == len(self.norms):
+            grown = np.zeros(max(count * 3 // 2, 16), dtype=np.float32)
+            grown[:count] = self.norms
+            self.norms = grown
+        self.norms[count] = np.linalg.norm(tf * idf[columns])
+        self.rows.append(row)
+        self.pending.append((columns, tf))
+
+    def compact(self):
+        if not self.pending:
+            return
+        columns = np.concatenate([columns for columns, _ in self.pending])
+        tf = np.concatenate([tf for _, tf in self.pending])
+        positions = np.repeat(np.arange(self.compacted, len(self.rows), dtype=np.int32),
+                              [len(columns) for columns, _ in self.pending])
+        order = np.argsort(columns, kind="stable")
+        columns, tf, positions = columns[order], tf[order], positions[order]
+        at = self.colptr[columns + 1]
+        self.positions = np.insert(self.positions, at, positions)
+        self.tf = np.insert(self.tf, at, tf)
+        self.colptr[1:] += np.cumsum(np.bincount(columns, minlength=len(self.colptr) - 1))
+        self.pending = []
+        self.compacted = len(self.rows)
+
+    def renormalize(self, idf):
+        self.compact()
+        columns = np.repeat(np.arange(len(idf)), np.diff(self.colptr))
+        weights = self.tf * idf[columns]
+        self.norms[:len(self.rows)] = np.sqrt(np.bincount(self.positions, weights * weights, minlength=len(self.rows)))
+
+    def scores(self, query):
+        """Cosine similarity of every row with a query already multiplied by the IDF weights"""
+        found = np.flatnonzero(query)
+        spans = [(self.colptr[column], self.colptr[column + 1]) for column in found]
+        dots = np.bincount(np.concatenate([self.positions[a:b] for a, b in spans]),
+                           np.concatenate([self.tf[a:b] * query[column] for column, (a, b) in zip(found, spans)]),
+                           minlength=len(self.rows))
+        for position, (columns, tf) in enumerate(self.pending, self.compacted):
+            dots[position] = tf @ query[columns]
+        return dots / self.norms[:len(self.rows)]
+
+    def nbytes(self):
+        return (self.norms.nbytes + self.colptr.nbytes + self.positions.nbytes + self.tf.nbytes
+                + sum(columns.nbytes + tf.nbytes for columns, tf in self.pending))
+
+
+class RetrievalIndex:
+    """Nearest saved prompt by cosine similarity.
+
+    A match must have the same signature(prompt) (e.g. the parsed intent and color) and the
+    same action words, which keeps "hide the sidebar" from matching "show the sidebar".
+    """
+
+    def __init__(self, dim=512, threshold=0.75, signature=None, ngram_sizes=(3, 4)):
+        self.dim = int(dim)
+        self.threshold = float(threshold)
+        self.signature = signature or (lambda prompt: None)
+        self.ngram_sizes = tuple(ngram_sizes)
+        self._lock = threading.RLock()
+        self.rebuilds = 0
+        self._reset()
+
+    def _reset(self):
+        self._rows = {}         # normalized prompt -> row
+        self._entries = []      # row -> (prompt, code, script_id)
+        self._groups = {}       # signature -> _Group
+        self._df = np.zeros(self.dim, dtype=np.float64)
+        self._idf = np.ones(self.dim, dtype=np.float32)
+        self._idf_rows = 0
+
+    def _signature(self, prompt, key):
+        return self.signature(prompt), _actions(key)
+
+    def _vectorize(self, text):
+        padded = f" {text} "
+        columns = np.array([zlib.crc32(padded[i:i + n].encode()) for n in self.ngram_sizes
+                            for i in range(len(padded) - n + 1)], dtype=np.int64) % self.dim
+        counts = np.bincount(columns, minlength=self.dim)
+        columns = np.flatnonzero(counts).astype(np.int32)
+        return columns, (1.0 + np.log(counts[columns])).astype(np.float32)
+
+    def _weighted_row(self, columns, tf):
+        row = np.zeros(self.dim, dtype=np.float32)
+        row[columns] = tf * self._idf[columns]
+        norm = np.linalg.norm(row)
+        return row / norm if norm else row
+
+    def _rebuild(self):
+        count = len(self._entries)
+        self._idf = (np.log((1.0 + count) / (1.0 + self._df)) + 1.0).astype(np.float32)
+        for group in self._groups.values():
+            group.renormalize(self._idf)
+        self._idf_rows = count
+        self.rebuilds += 1
+
+    def _prepare(self, prompt, code, script_id):
+        """Everything about an entry that can be computed without the lock"""
+        key = normalize(prompt)
+        if not key:
+            return None
+        return key, (prompt, code, script_id), self._vectorize(_content(key)), self._signature(prompt, key)
+
+    def _add(self, prepared):
+        """Record a prepared entry; returns its group if it is a new row, else None"""
+        key, entry, (columns, tf), signature = prepared
+        row = self._rows.get(key)
+        if row is not None:
+            self._entries[row] = entry
+            return None
+        row = len(self._entries)
+        self._rows[key] = row
+        self._entries.append(entry)
+        self._df[columns] += 1
+        group = self._groups.setdefault(signature, _Group(self.dim))
+        group.append(row, columns, tf, self._idf)
+        return group
+
+    def add(self, prompt, code, script_id=None):
+        """Index one prompt -> code pair; a prompt seen before just gets the new code"""
+        prepared = self._prepare(prompt, code, script_id)
+        if prepared is None:
+            return
+        with self._lock:
+            group = self._add(prepared)
+            if group is None:
+                return
+            if len(self._entries) >= 2 * self._idf_rows:
+                self._rebuild()
+            elif len(group.pending) >= _PENDING_ROWS:
+                group.compact()
+
+    def add_many(self, items):
+        """Index (prompt, code, script_id) tuples with a single rebuild at the end"""
+        prepared = [entry for entry in (self._prepare(*item) for item in items) if entry is not None]
+        with self._lock:
+            for entry in prepared:
+                self._add(entry)
+            self._rebuild()
+
+    def lookup(self, prompt, wait=0.005):
+        """Most similar stored entry with the same signature, if it clears the threshold.
+
+        Gives up (returns None) rather than wait more than `wait` seconds for a rebuild.
+        """
+        key = normalize(prompt)
+        if not key:
+            return None
+        signature = self._signature(prompt, key)
+        if not self._lock.acquire(timeout=wait):
+            return None
+        try:
+            row = self._rows.get(key)
+            if row is not None:
+                stored, code, script_id = self._entries[row]
+                return {"code": code, "prompt": stored, "script_id": script_id, "similarity": 1.0}
+            group = self._groups.get(signature)
+            if group is None or not group.rows:
+                return None
+            scores = group.scores(self._weighted_row(*self._vectorize(_content(key))) * self._idf)
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            if similarity < self.threshold:
+                return None
+            stored, code, script_id = self._entries[group.rows[best]]
+        finally:
+            self._lock.release()
+        return {"code": code, "prompt": stored, "script_id": script_id, "similarity": round(similarity, 4)}
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            vector_bytes = sum(group.nbytes() for group in self._groups.values())
+            return {
+                "entries": len(self._entries),
+                "groups": len(self._groups),
+                "dim": self.dim,
+                "threshold": self.threshold,
+                "rebuilds": self.rebuilds,
+                "vectors_mb": round(vector_bytes / (1024 * 1024), 1),
+            }
@@ -0,0 +1,235 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_FIELDS = ("id", "prompt", "code", "source", "success", "timestamp", "url", "platform")
+_SELECT = "SELECT id, prompt, code, source, success, timestamp, url, platform FROM scripts"
+
+
+class ScriptStore:
+    """Saved scripts in SQLite (WAL mode).
+
+    Appends cost the same no matter how many scripts exist, ids are allocated atomically by
+    SQLite, and lookups by id use the primary key instead of parsing a whole file.
+    """
+
+    def __init__(self, db_path, legacy_json_path=None):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scripts ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, prompt TEXT, code TEXT, source TEXT, "
+            "success INTEGER, timestamp TEXT, url TEXT, platform TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_scripts_url ON scripts (url, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_scripts_source ON scripts (source, id)")
+        # Random per database, so a recreated database never repeats an old version
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)", (uuid.uuid4().hex[:8],))
+        self._epoch = self._conn.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+        self._writes = 0
+        self._version_seen = None
+        self._version = None
+        self._listeners = []
+        if legacy_json_path and os.path.exists(legacy_json_path):
+            self._migrate(legacy_json_path)
+
+    def subscribe(self, callback):
+        """Call callback(ids) after every write; ids is None when any script may have changed"""
+        self._listeners.append(callback)
+
+    def _notify(self, ids):
+        for callback in self._listeners:
+            callback(ids)
+
+    @staticmethod
+    def _row_values(entry):
+        success = entry.get("success")
+        return (
+            entry.get("prompt"),
+            entry.get("code"),
+            entry.get("source"),
+            None if success is None else int(bool(success)),
+            entry.get("timestamp"),
+            entry.get("url"),
+            entry.get("platform"),
+        )
+
+    @staticmethod
+    def _row_to_dict(row):
+        script = dict(zip(SCRIPT_FIELDS, row))
+        if script["success"] is not None:
+            script["success"] = bool(script["success"])
+        return script
+
+    def _migrate(self, legacy_json_path):
+        """One-time import of the old working_scripts.json; the file is renamed afterwards.
+
+        The import is recorded in the meta table in the same transaction, so a crash before the
+        rename, or another process migrating at the same time, never imports the file twice.
+        """
+        try:
+            with open(legacy_json_path, 'r', encoding='utf-8') as f:
+                scripts = json.load(f)
+        except FileNotFoundError:
+            # Renamed by another process sharing the database
+            return
+        duplicates = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                migrated = self._conn.execute("SELECT value FROM meta WHERE key = 'legacy_json_migrated'").fetchone()
+                if migrated is None:
+                    for entry in scripts:
+                        cursor = self._conn.execute(
+                            "INSERT OR IGNORE INTO scripts (id, prompt, code, source, success, timestamp, url, platform) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (entry.get("id"),) + self._row_values(entry),
+                        )
+                        if cursor.rowcount == 0:
+                            duplicates.append(entry)
+                    # Concurrent saves in the old store could reuse an id; the first entry keeps it
+                    # and later ones are appended with fresh ids
+                    for entry in duplicates:
+                        self._conn.execute(
+                            "INSERT INTO scripts (prompt, code, source, success, timestamp, url, platform) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            self._row_values(entry),
+                        )
+                    self._conn.execute(
+                        "INSERT INTO meta (key, value) VALUES ('legacy_json_migrated', ?)", (os.path.abspath(legacy_json_path),)
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            if migrated is None:
+                self._writes += 1
+        if migrated is None:
+            self._notify(None)
+            logger.info("Migrated %d scripts from %s (%d duplicate ids renumbered)", len(scripts), legacy_json_path, len(duplicates))
+        else:
+            logger.info("%s was already imported from %s, only renaming it", legacy_json_path, migrated[0])
+        try:
+            os.replace(legacy_json_path, legacy_json_path + ".migrated")
+        except FileNotFoundError:
+            pass
+
+    def add(self, entry):
+        """Append one script and return its new id"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO scripts (prompt, code, source, success, timestamp, url, platform) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._row_values(entry),
+            )
+            self._writes += 1
+            script_id = cursor.lastrowid
+        self._notify([script_id])
+        return script_id
+
+    def add_many(self, entries):
+        """Append several scripts in one transaction; returns their new ids in order"""
+        ids = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for entry in entries:
+                    cursor = self._conn.execute(
+                        "INSERT INTO scripts (prompt, code, source, success, timestamp, url, platform) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        self._row_values(entry),
+                    )
+                    ids.append(cursor.lastrowid)
+                self._conn.execute("COMMIT")
+                self._writes += 1
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        self._notify(ids)
+        return ids
+
+    @property
+    def version(self):
+        """Opaque token that changes whenever the stored scripts change.
+
+        Derived from the database contents, so every process using the same database (e.g.
+        several HTTP workers) reports the same version. It is only recomputed after a write
+        through this connection or a commit by another one (PRAGMA data_version).
+        """
+        with self._lock:
+            seen = (self._conn.execute("PRAGMA data_version").fetchone()[0], self._writes)
+            if seen != self._version_seen:
+                max_id, count = self._conn.execute("SELECT MAX(id), COUNT(*) FROM scripts").fetchone()
+                self._version = f"{self._epoch}-{max_id or 0}-{count}"
+                self._version_seen = seen
+            return self._version
+
+    def get(self, script_id):
+        with self._lock:
+            row = self._conn.execute(_SELECT + " WHERE id = ?", (script_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def get_many(self, script_ids):
+        """Scripts for the given ids, in id order; unknown ids are skipped"""
+        ids = sorted(set(script_ids))
+        scripts = []
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            with self._lock:
+                rows = self._conn.execute(
+                    _SELECT + f" WHERE id IN ({','.join('?' * len(chunk))}) ORDER BY id", chunk
+                ).fetchall()
+            scripts.extend(self._row_to_dict(row) for row in rows)
+        return scripts
+
+    def all(self):
+        return self.list()
+
+    def list(self, after_id=0, limit=None, url=None, source=None, success=None, since=None, until=None):
+        """Scripts with id > after_id matching every given filter, in id order.
+
+        since/until bound the ISO timestamp string (inclusive).
+        """
+        clauses = ["id > ?"]
+        params = [after_id]
+        for clause, value in (("url = ?", url), ("source = ?", source), ("timestamp >= ?", since), ("timestamp <= ?", until)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        if success is not None:
+            clauses.append("success = ?")
+            params.append(int(bool(success)))
+        sql = _SELECT + " WHERE " + " AND ".join(clauses) + " ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def iter_scripts(self, after_id=0, page_size=500, **filters):
+        """Like list() without a limit, but fetched page by page so the lock is never held for long"""
+        while True:
+            page = self.list(after_id=after_id, limit=page_size, **filters)
+            yield from page
+            if len(page) < page_size:
+                return
+            after_id = page[-1]["id"]
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM scripts").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,105 @@
+"""Stop generation once the model has completed one JavaScript statement.
+
+The enhanced prompts are open statements (e.g. "...forEach(btn => btn.style.color = 'red'"),
+so the scanner starts from the prompt's state and the statement is complete at the first
+";" outside any string with every bracket closed.
+"""
+
+BANNED_TOKENS = ('def ', 'import ', '</')
+
+_OPENERS = {'(': ')', '[': ']', '{': '}'}
+_CLOSERS = {')', ']', '}'}
+_QUOTES = {"'", '"', '`'}
+
+
+def scan_js(text, state=None):
+    """Track bracket depth and the open quote across text; returns (depth, quote, escaped)"""
+    depth, quote, escaped = state or (0, None, False)
+    for ch in text:
+        if quote:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == quote:
+                quote = None
+        elif ch in _QUOTES:
+            quote = ch
+        elif ch in _OPENERS:
+            depth += 1
+        elif ch in _CLOSERS:
+            depth -= 1
+    return depth, quote, escaped
+
+
+def statement_end(output, prompt_state=None):
+    """Index just past the first complete statement in output, or None"""
+    depth, quote, escaped = prompt_state or (0, None, False)
+    for i, ch in enumerate(output):
+        depth, quote, escaped = scan_js(ch, (depth, quote, escaped))
+        if ch == ';' and quote is None and depth <= 0:
+            return i + 1
+    return None
+
+
+def banned_index(output):
+    """Index of the first banned token in output, or None"""
+    positions = [i for i in (output.find(token) for token in BANNED_TOKENS) if i != -1]
+    return min(positions) if positions else None
+
+
+def close_statement(code):
+    """Close an unfinished statement: open quote, open brackets, then ';'"""
+    depth, quote, _ = scan_js(code)
+    if quote:
+        code += quote
+    code += ')' * max(depth, 0)
+    return code if code.endswith(';') else code + ';'
+
+
+def make_stopping_criteria(tokenizer, prompts, cancel=None):
+    """StoppingCriteriaList that ends each row at a statement boundary or a banned token.
+
+    The returned criterion's `steps` lists, per prompt, how many tokens were decoded before it stopped.
+    If `cancel` (a threading.Event) is set, every row stops at the next token; `cancelled` marks the
+    rows that were still running then.
+    """
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class StatementStoppingCriteria(StoppingCriteria):
+        def __init__(self):
+            self.prompt_states = [scan_js(prompt) for prompt in prompts]
+            self.start = None
+            self.total_steps = 0
+            self.stopped_at = [None] * len(prompts)
+            self.cancelled = [False] * len(prompts)
+
+        @property
+        def steps(self):
+            return [self.total_steps if stop is None else stop for stop in self.stopped_at]
+
+        def __call__(self, input_ids, scores, **kwargs):
+            # First call comes after the first new token, so everything before it is prompt
+            if self.start is None:
+                self.start = input_ids.shape[-1] - 1
+            self.total_steps = input_ids.shape[-1] - self.start
+            if cancel is not None and cancel.is_set():
+                self.cancelled = [cancelled or stop is None for cancelled, stop in zip(self.cancelled, self.stopped_at)]
+                self.stopped_at = [self.total_steps if stop is None else stop for stop in self.stopped_at]
+                return torch.ones(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+            done = []
+            for row in range(input_ids.shape[0]):
+                # One sequence per prompt; anything else is left to the other criteria
+                if row >= len(prompts):
+                    done.append(False)
+                    continue
+                if self.stopped_at[row] is None:
+                    output = tokenizer.decode(input_ids[row, self.start:], skip_special_tokens=True)
+                    if statement_end(output, self.prompt_states[row]) is not None or banned_index(output) is not None:
+                        self.stopped_at[row] = self.total_steps
+                done.append(self.stopped_at[row] is not None)
+            return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+    criterion = StatementStoppingCriteria()
+    return StoppingCriteriaList([criterion]), criterion
@@ -0,0 +1,42 @@
+"""Server-Sent Events helpers for /generate_stream."""
+import json
+
+
+def sse_event(event, data):
+    """One SSE message with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def make_token_streamer(tokenizer, on_text):
+    """transformers streamer for a single sequence that calls on_text(text) with each newly decoded piece.
+
+    Unlike TextStreamer, which holds text back until a space, every token is passed on as soon as it
+    decodes to whole characters. on_text is called from the generating thread; the prompt is skipped.
+    """
+    from transformers.generation.streamers import BaseStreamer
+
+    class CallbackStreamer(BaseStreamer):
+        def __init__(self):
+            self.tokens = []
+            self.sent = 0
+            self.prompt_seen = False
+
+        def put(self, value):
+            # generate() first passes the prompt (or the decoder start token)
+            if not self.prompt_seen:
+                self.prompt_seen = True
+                return
+            self.tokens.extend(value.reshape(-1).tolist())
+            text = tokenizer.decode(self.tokens, skip_special_tokens=True)
+            # An incomplete multi-byte character decodes to U+FFFD; wait for the rest of it
+            if len(text) > self.sent and not text.endswith("�"):
+                on_text(text[self.sent:])
+                self.sent = len(text)
+
+        def end(self):
+            text = tokenizer.decode(self.tokens, skip_special_tokens=True)
+            if len(text) > self.sent:
+                on_text(text[self.sent:])
+            self.sent = len(text)
+
+    return CallbackStreamer()
@@ -0,0 +1,131 @@
+"""`python app.py --workers 2` end to end: model-side metrics and state reach every HTTP worker.
+
+Builds a tiny random GPT-2 with a character-level tokenizer, so it runs offline in a few seconds.
+"""
+import json
+import os
+import socket
+import string
+import subprocess
+import sys
+import time
+
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+httpx = pytest.importorskip("httpx")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_tiny_model(path):
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+
+    vocab = {"<pad>": 0, "<eos>": 1, "<unk>": 2}
+    for ch in string.printable:
+        vocab.setdefault(ch, len(vocab))
+    tokenizer = Tokenizer(models.WordLevel(vocab=vocab, unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Split("", behavior="isolated")
+    tokenizer.decoder = decoders.Fuse()
+    transformers.PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, pad_token="<pad>", eos_token="<eos>", unk_token="<unk>"
+    ).save_pretrained(path)
+    torch.manual_seed(0)
+    config = transformers.GPT2Config(vocab_size=len(vocab), n_positions=256, n_embd=32, n_layer=2, n_head=2,
+                                     bos_token_id=1, eos_token_id=1, pad_token_id=0)
+    transformers.GPT2LMHeadModel(config).save_pretrained(path)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def metric_value(text, sample):
+    for line in text.splitlines():
+        if line.startswith(sample + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+@pytest.fixture(scope="module")
+def workers(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("workers")
+    build_tiny_model(str(tmp / "tiny"))
+    (tmp / "models.json").write_text(json.dumps({"default": "tiny", "models": {"tiny": {"name": str(tmp / "tiny")}}}))
+    port = free_port()
+    env = {
+        **os.environ,
+        "MODELS_FILE": str(tmp / "models.json"),
+        "SCRIPTS_DB_PATH": str(tmp / "scripts.db"),
+        "QUALITY_VERDICT_FILE": str(tmp / "model_quality.json"),
+        "QUALITY_THRESHOLD": "-1",
+        "HF_HUB_OFFLINE": "1",
+        "GENERATION_DO_SAMPLE": "false",
+        "RESPONSE_CACHE_SIZE": "0",
+        "RETRIEVAL_THRESHOLD": "2",
+        "INFERENCE_STATUS_INTERVAL": "0.2",
+        "LOG_LEVEL": "WARNING",
+    }
+    for name in ("INFERENCE_SERVER", "ADMIN_TOKEN"):
+        env.pop(name, None)
+    process = subprocess.Popen([sys.executable, "app.py", "--workers", "2", "--port", str(port)], cwd=ROOT, env=env)
+    client = httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=60)
+    try:
+        deadline = time.time() + 180
+        ready = 0
+        # Requests land on either worker; several ready answers in a row means both are
+        while ready < 8:
+            assert process.poll() is None, "app.py --workers exited"
+            assert time.time() < deadline, "workers did not become ready"
+            try:
+                ready = ready + 1 if client.get("/readyz", params={"require_model": "true"}).status_code == 200 else 0
+            except httpx.TransportError:
+                ready = 0
+            time.sleep(0.1)
+        yield client
+    finally:
+        client.close()
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def test_workers_report_the_inference_process_metrics(workers):
+    for prompt in ("make buttons blue", "hide images", "make text bold", "change background to red"):
+        assert workers.get("/generate", params={"prompt": prompt, "deadline_ms": 0}).status_code == 200
+    # Past a status poll, every worker (whichever answers) reports the inference process's series
+    time.sleep(0.6)
+    for _ in range(6):
+        text = workers.get("/metrics").text
+        assert metric_value(text, 'model_loads_total{kind="initial",result="ok"}') == 1
+        assert metric_value(text, 'model_load_duration_seconds_count{kind="initial"}') == 1
+        assert metric_value(text, "inference_decode_steps_total") > 0
+        assert metric_value(text, "prompt_cache_hits_total") > 0
+        assert metric_value(text, "model_idle_seconds") is not None
+        stats = workers.get("/inference_stats").json()
+        assert stats["early_stopping"]["requests"] >= 4
+        assert stats["prompt_cache"]["prompts"] > 0
+
+
+def test_workers_mirror_the_full_model_state(workers):
+    for _ in range(6):
+        state = workers.get("/readyz").json()
+        assert state["status"] == "ready"
+        assert state["model_id"] == "tiny"
+        assert state["quality_cases"]
+        assert state["inference_server"]
+
+
+def test_admin_goes_through_the_inference_process(workers):
+    listed = workers.get("/admin/models").json()
+    assert listed["current"] == "tiny"
+    assert listed["status"] == "ready"
+    # Reloading the serving model swaps it for a fresh copy; 409 if another worker's request is still loading
+    assert workers.post("/admin/models/load", json={"model": "tiny"}).status_code in (202, 409)
+    deadline = time.time() + 60
+    while (workers.get("/admin/models").json()["swap"] or {}).get("status") not in ("done", "failed", "disabled"):
+        assert time.time() < deadline, "swap did not finish"
+        time.sleep(0.2)
+    assert workers.get("/admin/models").json()["swap"]["status"] == "done"
@@ -0,0 +1,39 @@
+"""Check the intent table against the golden corpus recorded from the original if/elif implementation.
+
+Usage: python tools/check_intents.py
+"""
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from intents import enhance_prompt_for_codet5, extract_color, generate_fallback_code  # noqa: E402
+
+FUNCTIONS = {
+    "extract_color": extract_color,
+    "enhance_prompt_for_codet5": enhance_prompt_for_codet5,
+    "generate_fallback_code": generate_fallback_code,
+}
+
+
+def main():
+    corpus_path = os.path.join(ROOT, "tools", "intent_golden.jsonl")
+    checked = 0
+    mismatches = 0
+    with open(corpus_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            case = json.loads(line)
+            for name, func in FUNCTIONS.items():
+                checked += 1
+                actual = func(case["prompt"])
+                if actual != case[name]:
+                    mismatches += 1
+                    print(f"❌ {name}({case['prompt']!r}): expected {case[name]!r}, got {actual!r}")
+    print(f"Checked {checked} outputs, {mismatches} mismatches")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())